@@ -1,18 +1,44 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_from_directory
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_from_directory, Response
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import os
-from functools import wraps
+import time
+import atexit
+from functools import wraps, lru_cache
 from fraud_detector import FraudDetector
+from batching import MicroBatcher
+from metrics import SampledProfiler, render_prometheus
+from feature_store import FeatureStore
+from prediction_cache import PredictionCache
+from user_cache import UserCache
+from demo_user_store import DemoUserStore
+from passwords import PasswordHasher
+from model_watcher import ModelWatcher
+from shadow import ShadowScorer, CANDIDATE_BUNDLE_PATH
 from supabase import create_client, Client
+from postgrest.utils import SyncClient
+import httpx
 from dotenv import load_dotenv
-import hashlib
 import uuid
 
 # Load environment variables
 load_dotenv()
 
+def pool_supabase_connections(client, pool_size, keepalive):
+    """Give the client's PostgREST session a pool of pool_size connections kept open for keepalive seconds"""
+    # supabase-py shares one session across requests, but keeps idle connections for only 5 seconds
+    session = client.postgrest.session
+    client.postgrest.session = SyncClient(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=keepalive),
+        follow_redirects=True,
+        http2=True
+    )
+    session.close()
+
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-change-in-production')
 
@@ -23,6 +49,11 @@ try:
     
     if supabase_url and supabase_key:
         supabase: Client = create_client(supabase_url, supabase_key)
+        pool_supabase_connections(
+            supabase,
+            int(os.getenv('SUPABASE_POOL_SIZE', 10)),
+            float(os.getenv('SUPABASE_KEEPALIVE_SECONDS', 60))
+        )
         print("✅ Supabase connected successfully!")
     else:
         supabase = None
@@ -33,21 +64,123 @@ except Exception as e:
 
 # Initialize fraud detector
 fraud_detector = FraudDetector()
+# Model family used when a model has to be trained; a saved bundle keeps its own
+fraud_detector.backend = os.getenv('MODEL_BACKEND', fraud_detector.backend)
+
+# Cache of /predict results for repeated transactions (PREDICTION_CACHE_SIZE=0 disables)
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', 10000))
+if PREDICTION_CACHE_SIZE > 0:
+    fraud_detector.prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, float(os.getenv('PREDICTION_CACHE_TTL', 300)))
+
+# Optional micro-batching of concurrent /predict calls; only useful with threaded
+# workers (e.g. gunicorn --threads 8), disabled when MICROBATCH_WINDOW_MS is 0
+MICROBATCH_WINDOW_MS = float(os.getenv('MICROBATCH_WINDOW_MS', 0))
+MICROBATCH_MAX_ROWS = int(os.getenv('MICROBATCH_MAX_ROWS', 256))
+prediction_batcher = None
+if MICROBATCH_WINDOW_MS > 0:
+    prediction_batcher = MicroBatcher(fraud_detector.predict_batch, MICROBATCH_WINDOW_MS, MICROBATCH_MAX_ROWS)
+
+# Server-side customer frequency and location risk, filled in when requests name them
+feature_store = FeatureStore(
+    half_life_hours=float(os.getenv('FEATURE_HALF_LIFE_HOURS', 168)),
+    path=os.getenv('FEATURE_STORE_PATH', 'feature_store.npz'),
+    capacity=int(os.getenv('FEATURE_STORE_CAPACITY', 2**18)),
+    retry_window=float(os.getenv('FEATURE_RETRY_WINDOW', 60)),
+    retry_capacity=int(os.getenv('FEATURE_RETRY_CAPACITY', 2**16))
+)
+feature_store.load()
+atexit.register(feature_store.save)
+
+# Fraction of /predict calls run under cProfile; captures are written to PROFILE_DIR
+prediction_profiler = SampledProfiler(float(os.getenv('PROFILE_SAMPLE_RATE', 0)), os.getenv('PROFILE_DIR', 'profiles'))
+
+# Background reload of a changed model bundle in every worker (0 disables), validated
+# on the labeled transactions in MODEL_CANARY_PATH (synthetic ones if unset)
+model_watcher = ModelWatcher(
+    fraud_detector,
+    check_interval=float(os.getenv('MODEL_RELOAD_INTERVAL', 5)),
+    canary_path=os.getenv('MODEL_CANARY_PATH')
+)
+
+# Share of /predict calls also scored by the candidate model in SHADOW_MODEL_PATH (0 disables),
+# using at most SHADOW_CPU_BUDGET seconds of CPU per second in each worker
+shadow_scorer = ShadowScorer(
+    fraud_detector,
+    path=os.getenv('SHADOW_MODEL_PATH') or CANDIDATE_BUNDLE_PATH,
+    sample_rate=float(os.getenv('SHADOW_SAMPLE_RATE', 0)),
+    cpu_budget=float(os.getenv('SHADOW_CPU_BUDGET', 0.05))
+)
+
+@app.before_request
+def start_model_watcher():
+    model_watcher.ensure_running()
 
-# In-memory storage for demo mode users
-demo_users = {}
+# Upper bound on transactions accepted by /predict/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 10000))
+
+# Storage for demo mode users: the DEMO_USERS_MAX most recently used in memory, all of
+# them in the SQLite file DEMO_USERS_DB if set
+demo_users = DemoUserStore(int(os.getenv('DEMO_USERS_MAX', 10000)), os.getenv('DEMO_USERS_DB') or None)
+
+# Columns of the users table the app reads; login needs password_hash, the profile page the rest
+USER_COLUMNS = 'id,email,password_hash,full_name,organization,phone,location,profile_picture,created_at'
+
+# Cache of Supabase user records for login and profile pages (USER_CACHE_SIZE=0 disables)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+user_cache = None
+if USER_CACHE_SIZE > 0:
+    user_cache = UserCache(USER_CACHE_SIZE, float(os.getenv('USER_CACHE_TTL', 60)))
+
+# scrypt cost (memory 128 * n * r bytes per hash) and the threads per worker that compute
+# hashes, at reduced CPU priority so login bursts leave /predict alone
+password_hasher = PasswordHasher(
+    n=int(os.getenv('PASSWORD_SCRYPT_N', 2**14)),
+    r=int(os.getenv('PASSWORD_SCRYPT_R', 8)),
+    p=int(os.getenv('PASSWORD_SCRYPT_P', 1)),
+    threads=int(os.getenv('PASSWORD_HASH_THREADS', 2)),
+    queue_limit=int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', 64)),
+    niceness=int(os.getenv('PASSWORD_HASH_NICENESS', 10))
+)
 
 # Helper functions for user management
 def hash_password(password):
-    """Hash password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash password with salted scrypt on the password hashing pool"""
+    return password_hasher.hash(password)
+
+@lru_cache(maxsize=1)
+def demo_admin_password_hash():
+    """Hash of the built-in demo account's password, computed once per process"""
+    return hash_password('password123')
+
+@lru_cache(maxsize=1)
+def dummy_password_hash():
+    """Hash checked for unknown emails, so they take as long to reject as a wrong password"""
+    return hash_password(os.urandom(16).hex())
+
+def check_password(user, password):
+    """Whether password is the user's, upgrading a legacy or outdated stored hash on success"""
+    matches, new_hash = password_hasher.verify(password, user['password_hash'])
+    if matches and new_hash:
+        update_user_profile(user['id'], {'password_hash': new_hash})
+    return matches
+
+def fetch_user(column, value):
+    """Get the user whose column equals value from Supabase, through the user cache"""
+    if user_cache is not None:
+        user = user_cache.get_by_email(value) if column == 'email' else user_cache.get_by_id(value)
+        if user:
+            return user
+    response = supabase.table('users').select(USER_COLUMNS).eq(column, value).execute()
+    user = response.data[0] if response.data else None
+    if user and user_cache is not None:
+        user_cache.put(user)
+    return user
 
 def get_user_by_email(email):
     """Get user by email from Supabase or demo mode"""
     if supabase:
         try:
-            response = supabase.table('users').select('*').eq('email', email).execute()
-            return response.data[0] if response.data else None
+            return fetch_user('email', email)
         except Exception as e:
             print(f"Error fetching user: {e}")
             return None
@@ -57,7 +190,7 @@ def get_user_by_email(email):
             return {
                 'id': 'demo-user-id',
                 'email': 'admin@example.com',
-                'password_hash': hash_password('password123'),
+                'password_hash': demo_admin_password_hash(),
                 'full_name': 'John Doe',
                 'organization': 'FraudShield Demo',
                 'phone': '+1 (555) 123-4567',
@@ -66,7 +199,7 @@ def get_user_by_email(email):
                 'created_at': '2023-01-01T00:00:00Z'
             }
         # Check in-memory demo users
-        return demo_users.get(email, None)
+        return demo_users.get_by_email(email)
 
 def create_user(email, password, full_name, organization=None):
     """Create a new user in Supabase or demo mode"""
@@ -81,7 +214,10 @@ def create_user(email, password, full_name, organization=None):
                 'created_at': datetime.now().isoformat()
             }
             response = supabase.table('users').insert(user_data).execute()
-            return response.data[0] if response.data else None
+            user = response.data[0] if response.data else None
+            if user and user_cache is not None:
+                user_cache.put(user)
+            return user
         except Exception as e:
             print(f"Error creating user: {e}")
             return None
@@ -96,25 +232,112 @@ def create_user(email, password, full_name, organization=None):
             'created_at': datetime.now().isoformat()
         }
         # Store in in-memory demo users storage
-        demo_users[email] = user_data
-        return user_data
+        return demo_users.add(user_data)
 
 def update_user_profile(user_id, data):
     """Update user profile data"""
     if supabase:
         try:
             response = supabase.table('users').update(data).eq('id', user_id).execute()
-            return response.data[0] if response.data else None
+            user = response.data[0] if response.data else None
+            if user_cache is not None:
+                if user:
+                    user_cache.put(user)
+                else:
+                    user_cache.invalidate(user_id)
+            return user
         except Exception as e:
             print(f"Error updating user: {e}")
+            if user_cache is not None:
+                user_cache.invalidate(user_id)
             return None
     else:
         # Demo mode - update in-memory storage
-        for email, user_data in demo_users.items():
-            if user_data['id'] == user_id:
-                user_data.update(data)
-                return user_data
-        return None
+        return demo_users.update(user_id, data)
+
+def parse_transaction(data, idempotency_key=None):
+    """Extract model features from a request payload, applying defaults"""
+    transaction_data = {
+        'amount': float(data.get('amount', 0)),
+        'hour': int(data.get('hour', 0)),
+        'merchant_category': data.get('merchant_category', 'unknown'),
+        'payment_method': data.get('payment_method', 'card'),
+        'customer_age': int(data.get('customer_age', 25)),
+        'transaction_frequency': int(data.get('transaction_frequency', 1)),
+        'location_risk_score': float(data.get('location_risk_score', 0.5))
+    }
+    
+    # Features the store knows override client-supplied values; a retry with the same
+    # Idempotency-Key header or transaction_id is counted once
+    customer_id, location = data.get('customer_id'), data.get('location')
+    if customer_id is not None or location is not None:
+        idempotency_key = idempotency_key or data.get('transaction_id')
+        transaction_data.update(feature_store.observe(customer_id, location, idempotency_key=idempotency_key))
+    return transaction_data
+
+def explain_requested(query_value, data):
+    """Whether a request asked for feature attributions (?explain=true or "explain": true)"""
+    value = query_value
+    if value is None and isinstance(data, dict):
+        value = data.get('explain', False)
+    return str(value).lower() in ('true', '1', 'yes')
+
+def make_prediction(transaction_data, explain=False):
+    """Score one parsed transaction, through the coalescer when it is enabled"""
+    # Explanations are computed per call, so those requests skip the coalescer
+    if prediction_batcher and not explain:
+        return prediction_batcher.predict(transaction_data)
+    return fraud_detector.predict(transaction_data, explain=explain)
+
+def score_transaction(transaction_data, explain=False):
+    """Score a parsed /predict transaction and build the response body"""
+    result = prediction_profiler.call(make_prediction, transaction_data, explain)
+    shadow_scorer.submit(transaction_data, result['fraud_probability'], result['is_fraud'])
+    
+    response = {
+        'success': True,
+        'fraud_probability': result['fraud_probability'],
+        'is_fraud': result['is_fraud'],
+        'risk_level': result['risk_level'],
+        'risk_factors': result['risk_factors'],
+        'risk_flags': result['risk_flags'],
+        'timestamp': datetime.now().isoformat()
+    }
+    if explain:
+        response['explanation'] = result['explanation']
+    return response
+
+def system_stats():
+    """Build the /stats response body"""
+    stats = {
+        'total_predictions': fraud_detector.total_predictions,
+        'fraud_detected': fraud_detector.fraud_detected,
+        'risk_levels': fraud_detector.risk_level_counts(),
+        'model_accuracy': fraud_detector.get_model_accuracy()
+    }
+    stats['feature_store'] = feature_store.stats()
+    stats['model'] = model_watcher.stats()
+    if fraud_detector.prediction_cache is not None:
+        stats['prediction_cache'] = fraud_detector.prediction_cache.stats()
+    if supabase and user_cache is not None:
+        stats['user_cache'] = user_cache.stats()
+    if not supabase:
+        stats['demo_users'] = demo_users.stats()
+    stats['passwords'] = password_hasher.stats()
+    if shadow_scorer.enabled:
+        stats['shadow'] = shadow_scorer.stats()
+    if prediction_batcher:
+        stats['microbatch'] = prediction_batcher.stats()
+    return stats
+
+def health_status():
+    """Build the /health response body"""
+    return {
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'model_loaded': fraud_detector.model is not None,
+        'supabase_connected': supabase is not None
+    }
 
 # Authentication decorator
 def login_required(f):
@@ -157,7 +380,11 @@ def login():
         # Get user from database
         user = get_user_by_email(email)
         
-        if user and user['password_hash'] == hash_password(password):
+        if user is None:
+            # Spend the same scrypt work as for a known email, so timing does not reveal which are registered
+            password_hasher.verify(password or '', dummy_password_hash())
+        
+        if user and check_password(user, password):
             session['logged_in'] = True
             session['user_id'] = user['id']
             session['user_email'] = user['email']
@@ -210,8 +437,7 @@ def profile():
     # Get user data from database
     if supabase and user_id:
         try:
-            response = supabase.table('users').select('*').eq('id', user_id).execute()
-            user = response.data[0] if response.data else None
+            user = fetch_user('id', user_id)
         except Exception as e:
             print(f"Error fetching user profile: {e}")
     
@@ -297,28 +523,48 @@ def predict_fraud():
     """Analyze transaction and predict fraud probability"""
     try:
         # Get transaction data from form
+        started = time.perf_counter_ns()
         data = request.get_json()
+        transaction_data = parse_transaction(data, request.headers.get('Idempotency-Key'))
+        explain = explain_requested(request.args.get('explain'), data)
+        fraud_detector.latency.record('parse', time.perf_counter_ns() - started)
         
-        # Extract transaction features
-        transaction_data = {
-            'amount': float(data.get('amount', 0)),
-            'hour': int(data.get('hour', 0)),
-            'merchant_category': data.get('merchant_category', 'unknown'),
-            'payment_method': data.get('payment_method', 'card'),
-            'customer_age': int(data.get('customer_age', 25)),
-            'transaction_frequency': int(data.get('transaction_frequency', 1)),
-            'location_risk_score': float(data.get('location_risk_score', 0.5))
-        }
+        return jsonify(score_transaction(transaction_data, explain))
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_fraud_batch():
+    """Analyze many transactions in a single vectorized model call"""
+    try:
+        started = time.perf_counter_ns()
+        data = request.get_json()
+        
+        # Accept either a bare list or {"transactions": [...]}
+        items = data.get('transactions', []) if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            raise ValueError('Expected a list of transactions')
+        if len(items) > MAX_BATCH_SIZE:
+            raise ValueError(f'Batch too large: {len(items)} transactions (max {MAX_BATCH_SIZE})')
         
-        # Make prediction
-        result = fraud_detector.predict(transaction_data)
+        # An Idempotency-Key on a batch names each of its rows by position
+        idempotency_key = request.headers.get('Idempotency-Key')
+        transactions = [parse_transaction(item, idempotency_key and f'{idempotency_key}/{i}')
+                        for i, item in enumerate(items)]
+        fraud_detector.latency.record('parse', time.perf_counter_ns() - started)
+        
+        # Make predictions
+        explain = explain_requested(request.args.get('explain'), data)
+        results = fraud_detector.predict_batch(transactions, explain=explain)
         
         return jsonify({
             'success': True,
-            'fraud_probability': result['fraud_probability'],
-            'is_fraud': result['is_fraud'],
-            'risk_level': result['risk_level'],
-            'risk_factors': result['risk_factors'],
+            'count': len(results),
+            'results': results,
             'timestamp': datetime.now().isoformat()
         })
         
@@ -331,28 +577,25 @@ def predict_fraud():
 @app.route('/stats')
 def get_stats():
     """Get system statistics"""
-    return jsonify({
-        'total_predictions': fraud_detector.total_predictions,
-        'fraud_detected': fraud_detector.fraud_detected,
-        'model_accuracy': fraud_detector.get_model_accuracy()
-    })
+    return jsonify(system_stats())
 
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
-        'model_loaded': fraud_detector.model is not None,
-        'supabase_connected': supabase is not None
-    })
+    return jsonify(health_status())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: prediction counters and per-stage latency histograms"""
+    body = render_prometheus(fraud_detector.counters.totals(), fraud_detector.latency)
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     print("Starting FraudShield application...")
     
-    # Ensure model is trained on startup
-    print("Training fraud detection model...")
-    fraud_detector.train_model()
+    # Load the saved model; training only happens when none exists
+    print("Loading fraud detection model...")
+    fraud_detector.preload()
     
     # Get port from environment variable (for deployment platforms like Render)
     port = int(os.environ.get('PORT', 5000))
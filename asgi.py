@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from uvicorn.middleware.wsgi import WSGIMiddleware
+from app import (app as flask_app, fraud_detector, model_watcher, explain_requested, parse_transaction,
+                 score_transaction, system_stats, health_status)
+
+# Async serving mode: /predict, /stats and /health are answered on the event loop
+# and share the FraudDetector from app.py; every other route is the Flask app.
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port $PORT
+#   gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+# Threads running model inference, and how many requests may be queued for them
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', 4))
+INFERENCE_QUEUE_LIMIT = int(os.getenv('INFERENCE_QUEUE_LIMIT', 1024))
+
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix='inference')
+inference_slots = None
+wsgi_app = WSGIMiddleware(flask_app)
+
+
+async def run_inference(func, *args):
+    """Run blocking model work on the bounded inference executor"""
+    global inference_slots
+    if inference_slots is None:
+        inference_slots = asyncio.Semaphore(INFERENCE_THREADS + INFERENCE_QUEUE_LIMIT)
+
+    # Requests beyond the bound wait here as cheap coroutines instead of piling into the executor
+    async with inference_slots:
+        return await asyncio.get_running_loop().run_in_executor(inference_executor, func, *args)
+
+
+async def read_body(receive):
+    """Collect the full HTTP request body"""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def send_json(send, payload, status=200):
+    """Send a JSON response"""
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def predict(scope, receive, send):
+    """Async /predict: parse on the loop, score on the inference executor"""
+    try:
+        body = await read_body(receive)
+        started = time.perf_counter_ns()
+        data = json.loads(body)
+        idempotency_key = dict(scope.get('headers', [])).get(b'idempotency-key')
+        transaction_data = parse_transaction(data, idempotency_key.decode() if idempotency_key else None)
+        query = parse_qs(scope.get('query_string', b'').decode())
+        explain = explain_requested(query['explain'][0] if 'explain' in query else None, data)
+        fraud_detector.latency.record('parse', time.perf_counter_ns() - started)
+        await send_json(send, await run_inference(score_transaction, transaction_data, explain))
+    except Exception as e:
+        await send_json(send, {'success': False, 'error': str(e)}, status=400)
+
+
+async def lifespan(receive, send):
+    """Load the model before accepting traffic"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if fraud_detector.model is None:
+                await run_inference(fraud_detector.preload)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            inference_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    model_watcher.ensure_running()
+    route = (scope.get('method'), scope['path'])
+    if route == ('POST', '/predict'):
+        await predict(scope, receive, send)
+    elif route == ('GET', '/stats'):
+        await send_json(send, system_stats())
+    elif route == ('GET', '/health'):
+        await send_json(send, health_status())
+    else:
+        await wsgi_app(scope, receive, send)
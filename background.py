@@ -0,0 +1,52 @@
+import os
+import threading
+
+
+def lower_thread_priority(niceness):
+    """Lower the calling thread's scheduling priority to niceness, where the OS allows it"""
+    if hasattr(os, 'setpriority') and hasattr(threading, 'get_native_id'):
+        try:
+            # On Linux a thread id names just this thread
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+        except OSError as e:
+            print(f"Could not lower the priority of thread {threading.current_thread().name}: {e}")
+
+
+class PerProcess:
+    """A value built by factory on first use in each process
+
+    Threads do not survive a fork, so each gunicorn worker has to start
+    its own background threads and pools. get() builds the value again the
+    first time it is called in a new process, and returns the same one from
+    then on.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._value = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._pid == os.getpid():
+            return self._value
+        with self._lock:
+            if self._pid != os.getpid():
+                self._value = self.factory()
+                self._pid = os.getpid()
+        return self._value
+
+
+def background_thread(target, name, niceness=None):
+    """PerProcess that starts a daemon thread running target, at niceness if given"""
+    def run():
+        if niceness is not None:
+            lower_thread_priority(niceness)
+        target()
+
+    def start():
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    return PerProcess(start)
@@ -0,0 +1,112 @@
+import bisect
+import threading
+import time
+from concurrent.futures import Future
+from background import background_thread
+
+
+class Histogram:
+    """Counts observations into power-of-two buckets"""
+
+    def __init__(self, max_value):
+        self.bounds = [1]
+        while self.bounds[-1] < max_value:
+            self.bounds.append(self.bounds[-1] * 2)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        buckets = [{'le': bound, 'count': count} for bound, count in zip(self.bounds, self.counts)]
+        buckets.append({'le': '+Inf', 'count': self.counts[-1]})
+        return {
+            'count': self.count,
+            'mean': round(self.sum / self.count, 2) if self.count else 0.0,
+            'max': self.max,
+            'buckets': buckets
+        }
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-item requests into one vectorized batch call
+
+    Items arriving within max_wait_ms of the oldest pending item, up to
+    max_batch_size of them, are scored together by predict_batch and each
+    result is handed back to the caller waiting on it.
+    """
+
+    def __init__(self, predict_batch, max_wait_ms=2.0, max_batch_size=256):
+        self.predict_batch = predict_batch
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+        self.queue_depth = Histogram(4096)
+        self.batch_size = Histogram(max_batch_size)
+        self._pending = []
+        self._condition = threading.Condition()
+        self._worker = background_thread(self._run, 'micro-batcher')
+
+    def submit(self, item):
+        """Queue an item and return a Future for its result"""
+        future = Future()
+        with self._condition:
+            self._worker.get()
+            self._pending.append((time.perf_counter(), item, future))
+            self.queue_depth.observe(len(self._pending))
+            self._condition.notify()
+        return future
+
+    def predict(self, item, timeout=None):
+        """Score one item through the coalescer, blocking until its batch is done"""
+        return self.submit(item).result(timeout)
+
+    def stats(self):
+        """Queue-depth and batch-size histograms for tuning the window"""
+        with self._condition:
+            return {
+                'max_wait_ms': self.max_wait_ms,
+                'max_batch_size': self.max_batch_size,
+                'pending': len(self._pending),
+                'queue_depth': self.queue_depth.snapshot(),
+                'batch_size': self.batch_size.snapshot()
+            }
+
+    def _next_batch(self):
+        """Block until a batch is full or its oldest item has waited max_wait_ms"""
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+
+            deadline = self._pending[0][0] + self.max_wait_ms / 1000.0
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            self.batch_size.observe(len(batch))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self.predict_batch([item for _, item, _ in batch])
+            except Exception:
+                # Score items one by one so a single bad item only fails its own caller
+                for _, item, future in batch:
+                    try:
+                        future.set_result(self.predict_batch([item])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+            else:
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
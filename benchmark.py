@@ -0,0 +1,793 @@
+#!/usr/bin/env python3
+"""
+Performance Benchmarks for FraudShield
+======================================
+
+This script measures the latency of the fraud detection hot paths.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import threading
+import multiprocessing
+import pickle
+import uuid
+import tracemalloc
+import json
+import importlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import average_precision_score, recall_score
+from sklearn.model_selection import train_test_split
+from fraud_detector import FraudDetector
+from forest_engine import CompiledForest
+from model_backends import MODEL_BACKENDS, create_model
+from model_watcher import ModelWatcher
+from shadow import ShadowScorer
+from prediction_cache import PredictionCache
+from user_cache import UserCache
+from demo_user_store import DemoUserStore
+from passwords import PasswordHasher
+
+def load_detector():
+    """Load the trained detector, training it if no model is saved"""
+    detector = FraudDetector()
+    if not detector.load_model():
+        detector.train_model()
+    return detector
+
+def sample_transactions(detector, n):
+    """Draw transactions from the synthetic generator as request dicts"""
+    df = detector.generate_synthetic_data(n).drop(columns=['is_fraud'])
+    return df.to_dict('records')
+
+def time_calls(func, transactions, warmup=100):
+    """Time func on each transaction, returning latencies in microseconds"""
+    for transaction in transactions[:warmup]:
+        func(transaction)
+
+    latencies = np.empty(len(transactions))
+    for i, transaction in enumerate(transactions):
+        start = time.perf_counter()
+        func(transaction)
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1e6
+
+def report(name, latencies):
+    """Print p50/p99/mean latency for one benchmark case"""
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"{name:<40} | p50 {p50:9.1f} us | p99 {p99:9.1f} us | mean {latencies.mean():9.1f} us")
+    return p50, p99
+
+def report_speedup(baseline, candidate):
+    """Print the p50/p99 speedup of candidate over baseline"""
+    print(f"{'speedup':<40} | p50 {baseline[0] / candidate[0]:8.1f}x    | p99 {baseline[1] / candidate[1]:8.1f}x")
+
+def benchmark_single(n=2000):
+    """Compare the DataFrame path with the DataFrame-free single transaction path"""
+    detector = load_detector()
+    transactions = sample_transactions(detector, n)
+
+    def dataframe_features(transaction):
+        return detector.prepare_features(pd.DataFrame([transaction]), fit=False)
+
+    def dataframe_predict(transaction):
+        return detector.model.predict_proba(dataframe_features(transaction))[0, 1]
+
+    print(f"\nSingle transaction latency ({n} transactions)")
+    print("=" * 50)
+
+    print("\nFeature preparation:")
+    baseline = report("DataFrame + encoders + scaler", time_calls(dataframe_features, transactions))
+    candidate = report("Preallocated NumPy row", time_calls(detector._transaction_to_row, transactions))
+    report_speedup(baseline, candidate)
+
+    print("\nEnd-to-end prediction:")
+    baseline = report("DataFrame path + predict_proba", time_calls(dataframe_predict, transactions))
+    candidate = report("FraudDetector.predict", time_calls(detector.predict, transactions))
+    report_speedup(baseline, candidate)
+
+def time_batch(func, X, min_time=0.5):
+    """Time repeated calls of func on X, returning seconds per call"""
+    func(X)
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+def benchmark_forest(batch_sizes=(1, 10, 100, 1000, 10000, 100000)):
+    """Compare sklearn predict_proba with the compiled flat-array forest"""
+    detector = load_detector()
+    forest = CompiledForest.from_sklearn(detector.model)
+    features = detector.generate_synthetic_data(max(batch_sizes)).drop(columns=['is_fraud'])
+    X_all = detector.prepare_features(features, fit=False)
+
+    print(f"\nForest inference ({forest.n_trees} trees, {forest.n_nodes} nodes, depth {forest.max_depth})")
+    print("=" * 50)
+    print(f"{'batch':>8} | {'sklearn':>12} | {'compiled':>12} | {'speedup':>8} | {'rows/s compiled':>16} | identical")
+
+    for batch_size in batch_sizes:
+        X = X_all[:batch_size]
+        identical = np.array_equal(detector.model.predict_proba(X), forest.predict_proba(X))
+        sklearn_time = time_batch(detector.model.predict_proba, X)
+        compiled_time = time_batch(forest.predict_proba, X)
+        print(f"{batch_size:>8} | {sklearn_time * 1e3:>9.3f} ms | {compiled_time * 1e3:>9.3f} ms | "
+              f"{sklearn_time / compiled_time:>7.1f}x | {batch_size / compiled_time:>16,.0f} | {identical}")
+
+def fold_check_inputs(detector, forest, n=20000, n_base=50):
+    """Raw feature rows for the fold check: synthetic transactions, every integer value of
+    integer-valued features, and both sides of every folded split threshold"""
+    df = detector.encode_categorical_features(detector.generate_synthetic_data(n), fit=False)
+    X = df[detector.feature_names].to_numpy(dtype=np.float64)
+    base = X[np.random.default_rng(0).choice(len(X), n_base, replace=False)]
+    rows = [X]
+
+    for j in range(X.shape[1]):
+        column = X[:, j]
+        if np.all(column == np.round(column)):
+            # Integer hours, category codes and counts land exactly on folded thresholds
+            values = np.arange(column.min() - 1, column.max() + 2)
+        else:
+            values = np.empty(0)
+        split = np.isfinite(forest.threshold) & (forest.feature == j)
+        values = np.unique(np.concatenate([values, forest.threshold[split], np.nextafter(forest.threshold[split], np.inf)]))
+        edge = np.repeat(base, len(values), axis=0)
+        edge[:, j] = np.tile(values, len(base))
+        rows.append(edge)
+    return np.vstack(rows)
+
+def benchmark_fold():
+    """Check that a scaler-folded compiled forest scores exactly like the scaled sklearn pipeline"""
+    detector = load_detector()
+    start = time.perf_counter()
+    folded = CompiledForest.from_sklearn(detector.model).fold_scaler(detector.scaler.mean_, detector.scaler.scale_)
+    fold_time = time.perf_counter() - start
+    X = fold_check_inputs(detector, folded)
+
+    scaled = detector.scaler.transform(pd.DataFrame(X, columns=detector.feature_names))
+    expected = detector.model.predict_proba(scaled)
+    actual = folded.predict_proba(X)
+    mismatched = int(np.count_nonzero(np.any(expected != actual, axis=1)))
+
+    print(f"\nScaler folding ({folded.n_trees} trees, {int(np.isfinite(folded.threshold).sum())} splits, "
+          f"folded in {fold_time * 1e3:.0f} ms)")
+    print("=" * 50)
+    print(f"{'rows checked':<40} | {len(X)} (synthetic, integer values and both sides of every threshold)")
+    print(f"{'rows differing from scaled pipeline':<40} | {mismatched}")
+    if mismatched:
+        raise AssertionError(f"folded forest differs from the scaled pipeline on {mismatched} rows")
+
+def benchmark_ingest(n=50, chunksize=20):
+    """Check that streaming a CSV with blank and unparseable timestamps yields a complete sample"""
+    directory = tempfile.mkdtemp()
+    try:
+        rng = np.random.default_rng(0)
+        times = pd.date_range('2024-01-01', periods=n, freq='37min').astype(str).tolist()
+        times[25] = ''
+        times[3] = 'not a time'
+        pd.DataFrame({
+            'amount': rng.uniform(10, 5000, n).round(2),
+            'transaction_time': times,
+            'merchant_category': rng.choice(['grocery', 'online', 'travel'], n),
+            'payment_method': rng.choice(['upi', 'card'], n),
+            'customer_age': rng.integers(18, 70, n),
+            'customer_id': rng.integers(0, 10, n),
+            'location': rng.choice(['mumbai', 'delhi', 'pune'], n),
+            'is_fraud': rng.integers(0, 2, n)
+        }).to_csv(os.path.join(directory, 'transactions.csv'), index=False)
+
+        detector = FraudDetector()
+        detector.data_path = directory
+        detector.ingest_workers = 1
+        detector.chunksize = chunksize
+        df = detector.stream_real_data(os.path.join(directory, 'transactions.csv'))
+
+        print(f"\nIngest check ({n} rows, 2 blank or unparseable timestamps, chunks of {chunksize})")
+        print("=" * 50)
+        print(f"{'rows sampled':<40} | {len(df)}")
+        print(f"{'hour dtype, range':<40} | {df['hour'].dtype}, {df['hour'].min()}-{df['hour'].max()}")
+        print(f"{'missing values':<40} | {int(df.isna().sum().sum())}")
+        if len(df) != n or df['hour'].dtype != np.int8 or df.isna().any().any() or not df['hour'].between(0, 23).all():
+            raise AssertionError("streamed sample is incomplete or has missing or out-of-range hours")
+    finally:
+        shutil.rmtree(directory)
+
+def benchmark_explain(batch_sizes=(1, 10, 100, 1000, 10000)):
+    """Cost of Saabas attributions relative to scoring the same rows"""
+    detector = load_detector()
+    forest = detector.compiled_forest
+    features = detector.generate_synthetic_data(max(batch_sizes)).drop(columns=['is_fraud'])
+    X_all = detector.prepare_features(features, fit=False, scale=not detector.scaler_folded)
+
+    print(f"\nFeature attributions ({forest.n_trees} trees, depth {forest.max_depth})")
+    print("=" * 50)
+    print(f"{'batch':>8} | {'score':>12} | {'explain':>12} | {'ratio':>8} | max |bias + sum - p|")
+
+    for batch_size in batch_sizes:
+        X = X_all[:batch_size]
+        bias, contributions = forest.contributions(X)
+        error = np.abs(bias + contributions.sum(axis=1) - forest.predict_proba(X)[:, 1]).max()
+        score_time = time_batch(forest.predict_proba, X)
+        explain_time = time_batch(forest.contributions, X)
+        print(f"{batch_size:>8} | {score_time * 1e3:>9.3f} ms | {explain_time * 1e3:>9.3f} ms | "
+              f"{explain_time / score_time:>7.2f}x | {error:.1e}")
+
+def benchmark_backends(n=2000, batch_size=1000):
+    """Train every model backend on the same split and compare cost and accuracy"""
+    detector = FraudDetector()
+    df = detector.load_real_data()
+    if df is None:
+        df = detector.generate_synthetic_data()
+    X = detector.prepare_features(df, fit=True)
+    y = df['is_fraud'].values
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    detector._build_lookup_tables()
+    transactions = sample_transactions(detector, n)
+    batch = transactions[:batch_size]
+
+    print(f"\nModel backends ({len(X_train):,} training rows, {len(X_test):,} test rows)")
+    print("=" * 50)
+    print(f"{'backend':<24} | {'train':>8} | {'size':>9} | {'p50 single':>10} | {'p99 single':>10} | "
+          f"{'batch ' + str(batch_size):>11} | {'PR-AUC':>6} | recall")
+
+    for backend in MODEL_BACKENDS:
+        detector.backend = backend
+        detector.model = create_model(backend)
+        start = time.perf_counter()
+        detector.model.fit(X_train, y_train)
+        train_time = time.perf_counter() - start
+        detector.compile_model()
+
+        proba = detector.model.predict_proba(X_test)[:, 1]
+        size_mb = len(pickle.dumps(detector.model)) / 2**20
+        p50, p99 = np.percentile(time_calls(detector.predict, transactions), [50, 99])
+        batch_time = time_batch(detector.predict_batch, batch)
+        print(f"{backend:<24} | {train_time:>7.1f}s | {size_mb:>6.1f} MB | {p50:>7.0f} us | {p99:>7.0f} us | "
+              f"{batch_time * 1e3:>8.1f} ms | {average_precision_score(y_test, proba):>6.3f} | "
+              f"{recall_score(y_test, proba > 0.5):.3f}")
+
+def benchmark_incremental(n_new=2000, n_new_trees=20, retire_trees=20):
+    """Full retrain vs. adding trees fitted on newly labeled transactions"""
+    directory = tempfile.mkdtemp()
+    try:
+        detector = artifact_detector(directory)
+        start = time.perf_counter()
+        detector.train_model()
+        full_time = time.perf_counter() - start
+
+        # A new batch of labels, with a merchant category the encoders have not seen
+        new = detector.generate_synthetic_data(n_new * 5).sample(n_new, random_state=1).reset_index(drop=True)
+        new.loc[new.index % 10 == 0, 'merchant_category'] = 'crypto'
+        start = time.perf_counter()
+        detector.update_model(new, n_new_trees=n_new_trees, retire_trees=retire_trees)
+        update_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+
+    print(f"\nIncremental training ({n_new:,} new transactions, +{n_new_trees}/-{retire_trees} trees)")
+    print("=" * 50)
+    print(f"{'Full retrain':<40} | {full_time:8.2f} s")
+    print(f"{'Warm-start update':<40} | {update_time:8.2f} s")
+    print(f"{'speedup':<40} | {full_time / update_time:8.1f}x")
+
+def paced_calls(func, transactions, rate):
+    """Time func on each transaction, issuing rate calls per second, in microseconds"""
+    latencies = np.empty(len(transactions))
+    next_call = time.perf_counter()
+    for i, transaction in enumerate(transactions):
+        next_call += 1.0 / rate
+        start = time.perf_counter()
+        func(transaction)
+        latencies[i] = time.perf_counter() - start
+        time.sleep(max(0.0, next_call - time.perf_counter()))
+    return latencies * 1e6
+
+def benchmark_hotswap(n=10000, rate=1000, swap_interval=0.5):
+    """Single-transaction latency while new model bundles are swapped in"""
+    directory = tempfile.mkdtemp()
+    try:
+        detector = artifact_detector(directory)
+        detector.train_model()
+        # A second version to alternate with through rollback_model
+        detector.model_params = {'n_estimators': 80}
+        detector.train_model()
+        detector.load_model(mmap_mode='r')
+        watcher = ModelWatcher(detector, check_interval=0.05)
+        transactions = sample_transactions(detector, n)
+
+        print(f"\nHot model swap ({n} transactions at {rate}/s, new bundle every {swap_interval}s)")
+        print("=" * 50)
+        baseline = report("No swaps", paced_calls(detector.predict, transactions, rate))
+
+        stop = threading.Event()
+        def swap():
+            while not stop.wait(swap_interval):
+                detector.rollback_model()
+        swapper = threading.Thread(target=swap, daemon=True)
+        watcher.ensure_running()
+        swapper.start()
+        candidate = report("Swapping", paced_calls(detector.predict, transactions, rate))
+        stop.set()
+        swapper.join()
+        print(f"{'models swapped in':<40} | {watcher.reloads}")
+        report_speedup(baseline, candidate)
+    finally:
+        shutil.rmtree(directory)
+
+def check_shadow_scores(shadow, transactions):
+    """Fail unless batched shadow scores equal the candidate's scores computed one row at a time"""
+    candidate = shadow.candidate
+    batch = [(transaction, 0.0, False) for transaction in transactions]
+    expected = [candidate.compiled_forest.predict_proba(shadow.detector._transaction_to_row(transaction, candidate))[0, 1]
+                for transaction in transactions]
+    if not np.array_equal(shadow.score(batch), expected):
+        raise AssertionError("batched shadow scores differ from per-row candidate scores")
+
+def benchmark_shadow(n=10000, rate=1000, cpu_budgets=(0.05, 1.0)):
+    """Single-transaction latency with every request also shadow-scored by a candidate model"""
+    directory = tempfile.mkdtemp()
+    try:
+        detector = artifact_detector(directory)
+        detector.train_model()
+        candidate_path = os.path.join(directory, 'model_bundle_candidate.joblib')
+        candidate = artifact_detector(directory)
+        candidate.bundle_path = candidate_path
+        candidate.model_params = {'n_estimators': 200, 'max_depth': 14}
+        candidate.train_model()
+        transactions = sample_transactions(detector, n)
+
+        print(f"\nShadow scoring ({n} transactions at {rate}/s, sample rate 1.0)")
+        print("=" * 50)
+        baseline = report("No shadow", paced_calls(detector.predict, transactions, rate))
+        for cpu_budget in cpu_budgets:
+            shadow = ShadowScorer(detector, candidate_path, sample_rate=1.0, cpu_budget=cpu_budget)
+            shadow.submit(transactions[0], 0.0, False)
+            while shadow.candidate is None:
+                time.sleep(0.01)
+            check_shadow_scores(shadow, transactions[:200])
+
+            def predict(transaction):
+                result = detector.predict(transaction)
+                shadow.submit(transaction, result['fraud_probability'], result['is_fraud'])
+
+            start = time.perf_counter()
+            candidate = report(f"Shadow, CPU budget {cpu_budget}", paced_calls(predict, transactions, rate))
+            elapsed = time.perf_counter() - start
+            stats = shadow.stats()
+            print(f"{'':<40} | scored {stats['scored']}, dropped {stats['dropped_over_budget']} over budget and "
+                  f"{stats['dropped_queue_full']} on a full queue, {stats['cpu_seconds'] / elapsed:.1%} CPU, "
+                  f"disagreement {stats.get('disagreement_rate', 0):.2%}")
+            report_speedup(baseline, candidate)
+    finally:
+        shutil.rmtree(directory)
+
+def benchmark_cache(n=20000, repeat_shares=(0.0, 0.5, 0.9)):
+    """Single-transaction latency with the prediction cache for varying shares of repeated requests"""
+    detector = load_detector()
+    unique = sample_transactions(detector, n)
+    rng = np.random.default_rng(42)
+
+    print(f"\nPrediction cache ({n} transactions per run)")
+    print("=" * 50)
+    for repeat_share in repeat_shares:
+        # Each request repeats an earlier one with probability repeat_share
+        transactions = []
+        for transaction in unique:
+            if transactions and rng.random() < repeat_share:
+                transaction = transactions[rng.integers(len(transactions))]
+            transactions.append(transaction)
+
+        print(f"\n{repeat_share:.0%} repeated transactions:")
+        detector.prediction_cache = None
+        baseline = report("No cache", time_calls(detector.predict, transactions))
+        detector.prediction_cache = PredictionCache(max_entries=n)
+        candidate = report("PredictionCache", time_calls(detector.predict, transactions, warmup=0))
+        print(f"{'hit rate':<40} | {detector.prediction_cache.stats()['hit_rate']:.1%}")
+        report_speedup(baseline, candidate)
+
+class MockSupabaseHandler(BaseHTTPRequestHandler):
+    """PostgREST's users endpoint over an in-memory table, counting round trips and connections"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, each response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_users(self, method):
+        self.server.round_trips += 1
+        time.sleep(self.server.latency)
+        query = dict(parse_qsl(urlsplit(self.path).query))
+        columns = query.pop('select', '*')
+        filters = {column: value.split('.', 1)[1] for column, value in query.items()}
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or 'null')
+
+        users = self.server.users
+        if method == 'POST':
+            users[body['id']] = body
+            rows = [body]
+        else:
+            rows = [user for user in users.values() if all(str(user.get(k)) == v for k, v in filters.items())]
+            if method == 'PATCH':
+                for user in rows:
+                    user.update(body)
+        if columns != '*':
+            rows = [{column: user.get(column) for column in columns.split(',')} for user in rows]
+
+        payload = json.dumps(rows).encode()
+        self.send_response(201 if method == 'POST' else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self.handle_users('GET')
+
+    def do_POST(self):
+        self.handle_users('POST')
+
+    def do_PATCH(self):
+        self.handle_users('PATCH')
+
+def benchmark_users(n_users=200, latency=0.005):
+    """Supabase round trips and latency per account page against a local mock PostgREST server"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockSupabaseHandler)
+    server.users, server.round_trips, server.connections, server.latency = {}, 0, 0, latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.update({
+        'SUPABASE_URL': f"http://127.0.0.1:{server.server_address[1]}",
+        'SUPABASE_ANON_KEY': 'mock.supabase.key',
+        'MODEL_RELOAD_INTERVAL': '0'
+    })
+    app_module = importlib.import_module('app')
+    pool = app_module.supabase.postgrest.session
+    client = app_module.app.test_client()
+
+    pages = [
+        ('register', lambda i: client.post('/auth/register', data={
+            'email': f"user{i}@example.com", 'password': 'secret', 'fullName': f"User {i}"})),
+        ('login', lambda i: client.post('/auth/login', data={'email': f"user{i}@example.com", 'password': 'secret'})),
+        ('profile', lambda i: client.get('/profile')),
+        ('profile update', lambda i: client.post('/api/profile/update', data={'location': f"City {i}"})),
+        ('profile after update', lambda i: client.get('/profile')),
+    ]
+    cases = [
+        ('No cache, no keep-alive', None, 0),
+        ('No cache, pooled connections', None, 60),
+        ('UserCache, pooled connections', UserCache(), 60),
+    ]
+
+    print(f"\nAccount pages ({n_users} users, {latency * 1e3:.0f} ms simulated Supabase latency)")
+    print("=" * 50)
+    for name, cache, keepalive in cases:
+        app_module.user_cache = cache
+        app_module.pool_supabase_connections(app_module.supabase, 10, keepalive)
+        server.users.clear()
+        print(f"\n{name}:")
+        connections = server.connections
+        for page, request in pages:
+            round_trips = server.round_trips
+            latencies = np.empty(n_users)
+            for i in range(n_users):
+                start = time.perf_counter()
+                request(f"{name}-{i}")
+                latencies[i] = time.perf_counter() - start
+            latencies *= 1e6
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"{page:<24} | {(server.round_trips - round_trips) / n_users:4.2f} round trips/page | "
+                  f"p50 {p50:9.1f} us | p99 {p99:9.1f} us")
+        print(f"{'connections opened':<24} | {server.connections - connections}")
+    server.shutdown()
+
+def demo_user(i):
+    """A user record shaped like the ones create_user stores in demo mode"""
+    return {
+        'id': str(uuid.uuid4()),
+        'email': f"user{i}@example.com",
+        'password_hash': '0' * 64,
+        'full_name': f"User {i}",
+        'organization': 'FraudShield Demo',
+        'created_at': '2024-01-01T00:00:00'
+    }
+
+def legacy_update_user(demo_users, user_id, data):
+    """Demo profile update as it was before DemoUserStore: a scan of every user for the id"""
+    for email, user_data in demo_users.items():
+        if user_data['id'] == user_id:
+            user_data.update(data)
+            return user_data
+    return None
+
+def benchmark_demo_users(sizes=(1000, 10000, 100000), max_users=10000, n_updates=1000):
+    """Profile update latency and memory after registering many demo-mode users"""
+    rng = np.random.default_rng(42)
+    directory = tempfile.mkdtemp()
+    try:
+        for n in sizes:
+            users = [demo_user(i) for i in range(n)]
+            # Updates go to random users among the max_users registered last, or among all of them
+            recent = [users[i]['id'] for i in rng.integers(max(0, n - max_users), n, n_updates)]
+            any_user = [users[i]['id'] for i in rng.integers(0, n, n_updates)]
+            cases = [
+                ('dict + id scan', None, recent),
+                ('DemoUserStore', DemoUserStore(max_users), recent),
+                ('DemoUserStore + SQLite, any user', DemoUserStore(max_users, os.path.join(directory, f"{n}.db")), any_user),
+            ]
+
+            print(f"\nDemo users ({n} registered, cap {max_users}, {n_updates} profile updates)")
+            print("=" * 50)
+            for name, store, user_ids in cases:
+                tracemalloc.start()
+                if store is None:
+                    store = {}
+                    for user in users:
+                        store[user['email']] = dict(user)
+                    update = lambda user_id: legacy_update_user(store, user_id, {'location': 'Pune'})
+                else:
+                    for user in users:
+                        store.add(dict(user))
+                    update = lambda user_id: store.update(user_id, {'location': 'Pune'})
+                memory = tracemalloc.get_traced_memory()[0] / 2**20
+                tracemalloc.stop()
+                latencies = time_calls(update, user_ids, warmup=0)
+                report(name, latencies)
+                print(f"{'':<40} | {len(store)} users in memory, {memory:.1f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+def run_for(func, duration, latencies):
+    """Call func repeatedly for duration seconds, appending latencies in microseconds"""
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1e6)
+
+def benchmark_logins(duration=5.0, predict_threads=4, login_threads=8):
+    """/predict throughput during a burst of scrypt logins, hashed inline or on the password pool"""
+    detector = load_detector()
+    transactions = sample_transactions(detector, 1000)
+    hasher = PasswordHasher()
+    stored = hasher.hash('correct horse battery staple')
+    cases = [
+        ('No logins', None),
+        ('scrypt on request threads', lambda: hasher._verify('correct horse battery staple', stored)),
+        ('scrypt on PasswordHasher pool', lambda: hasher.verify('correct horse battery staple', stored)),
+    ]
+
+    print(f"\nLogin burst ({predict_threads} /predict threads, {login_threads} login threads, {duration:.0f}s, "
+          f"scrypt n={hasher.n} r={hasher.r} on {os.cpu_count()} CPUs)")
+    print("=" * 50)
+    baseline = None
+    for name, login in cases:
+        predictions = [[] for _ in range(predict_threads)]
+        logins = [[] for _ in range(login_threads)]
+        workers = [threading.Thread(target=run_for, args=(
+            lambda i=i: detector.predict(transactions[i % len(transactions)]), duration, predictions[i]))
+            for i in range(predict_threads)]
+        if login is not None:
+            workers += [threading.Thread(target=run_for, args=(login, duration, logins[i])) for i in range(login_threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        latencies = np.concatenate(predictions)
+        throughput = len(latencies) / duration
+        baseline = baseline or throughput
+        report(name, latencies)
+        login_latencies = np.concatenate(logins) if login is not None else np.zeros(1)
+        print(f"{'':<40} | {throughput:7.0f} predictions/s ({throughput / baseline:.0%}) | "
+              f"{sum(map(len, logins)) / duration:5.1f} logins/s, p50 {np.median(login_latencies) / 1e3:.0f} ms")
+
+def legacy_encode(detector, df):
+    """Categorical encoding as it was before the lookup tables: isin, masked copy, LabelEncoder.transform"""
+    for feature in ['merchant_category', 'payment_method']:
+        encoder = detector.label_encoders[feature]
+        values = df[feature].copy()
+        mask = ~values.isin(encoder.classes_)
+        if mask.any():
+            values[mask] = encoder.classes_[0]
+        df[f'{feature}_encoded'] = encoder.transform(values)
+    return df
+
+def benchmark_encode(batch_sizes=(1, 100, 10000, 1000000)):
+    """Compare LabelEncoder.transform with the precomputed category lookup tables"""
+    detector = load_detector()
+    categories = {
+        feature: list(encoder.classes_) + ['never_seen']
+        for feature, encoder in detector.label_encoders.items()
+    }
+    rng = np.random.default_rng(42)
+
+    print(f"\nCategorical encoding (2 columns, including unseen categories)")
+    print("=" * 50)
+    print(f"{'batch':>8} | {'LabelEncoder':>12} | {'lookup':>12} | {'categorical':>12} | {'speedup':>8} | identical")
+
+    for batch_size in batch_sizes:
+        df = pd.DataFrame({
+            feature: rng.choice(values, batch_size) for feature, values in categories.items()
+        })
+        categorical = df.astype('category')
+        expected = legacy_encode(detector, df.copy())
+        actual = detector.encode_categorical_features(df.copy(), fit=False)
+        from_categorical = detector.encode_categorical_features(categorical.copy(), fit=False)
+        columns = ['merchant_category_encoded', 'payment_method_encoded']
+        identical = (np.array_equal(expected[columns].to_numpy(), actual[columns].to_numpy())
+                     and np.array_equal(expected[columns].to_numpy(), from_categorical[columns].to_numpy()))
+
+        legacy_time = time_batch(lambda X: legacy_encode(detector, X.copy()), df)
+        lookup_time = time_batch(lambda X: detector.encode_categorical_features(X.copy(), fit=False), df)
+        categorical_time = time_batch(lambda X: detector.encode_categorical_features(X.copy(), fit=False), categorical)
+        print(f"{batch_size:>8} | {legacy_time * 1e3:>9.3f} ms | {lookup_time * 1e3:>9.3f} ms | "
+              f"{categorical_time * 1e3:>9.3f} ms | {legacy_time / lookup_time:>7.1f}x | {identical}")
+
+def memory_kb():
+    """Rss, Pss and unique (private) memory of this process from /proc, in kB"""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': fields['Rss'],
+        'pss': fields['Pss'],
+        'uss': fields['Private_Clean'] + fields['Private_Dirty']
+    }
+
+def artifact_detector(directory):
+    """A detector whose artifacts live in directory"""
+    detector = FraudDetector()
+    for attr in ('bundle_path', 'model_path', 'scaler_path', 'encoders_path'):
+        setattr(detector, attr, os.path.join(directory, getattr(detector, attr)))
+    return detector
+
+def run_workers(directory, mode, n_workers, transactions, results):
+    """Fork workers the way gunicorn does and report each worker's memory"""
+    detector = artifact_detector(directory)
+    if mode == 'preload':
+        detector.load_model(mmap_mode='r')
+
+    barrier = multiprocessing.Barrier(n_workers + 1)
+    workers = []
+    for _ in range(n_workers):
+        pid = os.fork()
+        if pid == 0:
+            # Worker: load lazily unless preloaded, serve some traffic, then report
+            if detector.model is None:
+                detector.load_model()
+            for transaction in transactions:
+                detector.predict(transaction)
+            barrier.wait()
+            results.put(memory_kb())
+            # Flush the queue's feeder thread before the hard exit
+            results.close()
+            results.join_thread()
+            barrier.wait()
+            os._exit(0)
+        workers.append(pid)
+
+    barrier.wait()
+    barrier.wait()
+    for pid in workers:
+        os.waitpid(pid, 0)
+
+def benchmark_startup(n_workers=4):
+    """Cold-start time and per-worker memory for the legacy and bundled artifacts"""
+    detector = load_detector()
+    transactions = sample_transactions(detector, 200)
+    directory = tempfile.mkdtemp()
+
+    try:
+        # Legacy three-file layout and the single versioned bundle, side by side
+        legacy = artifact_detector(directory)
+        legacy.bundle_path = os.path.join(directory, 'absent.joblib')
+        joblib.dump(detector.model, legacy.model_path)
+        joblib.dump(detector.scaler, legacy.scaler_path)
+        joblib.dump(detector.label_encoders, legacy.encoders_path)
+        bundled = artifact_detector(directory)
+        bundled.model, bundled.scaler, bundled.label_encoders = detector.model, detector.scaler, detector.label_encoders
+        bundled.save_model()
+
+        print(f"\nCold start (fresh interpreter, best of 3)")
+        print("=" * 50)
+        cases = [
+            ('Legacy joblib files', "d.bundle_path = 'absent'; d.load_model()"),
+            ('Single bundle', "d.load_model()"),
+            ('Single bundle, mmap_mode=r', "d.load_model(mmap_mode='r')"),
+        ]
+        for name, load in cases:
+            code = (
+                "import time; start = time.perf_counter()\n"
+                "import benchmark\n"
+                "imported = time.perf_counter()\n"
+                f"d = benchmark.artifact_detector({directory!r}); {load}\n"
+                "print(imported - start, time.perf_counter() - imported)"
+            )
+            timings = []
+            for _ in range(3):
+                output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+                timings.append([float(value) for value in output.stdout.strip().splitlines()[-1].split()])
+            import_time, load_time = np.min(timings, axis=0)
+            print(f"{name:<40} | imports {import_time * 1e3:7.1f} ms | model load {load_time * 1e3:7.1f} ms")
+
+        print(f"\nPer-worker memory ({n_workers} forked workers after 200 predictions each)")
+        print("=" * 50)
+        context = multiprocessing.get_context('fork')
+        for mode, name in [('lazy', 'Lazy load in every worker'), ('preload', 'Preloaded mmap bundle before fork')]:
+            results = context.Queue()
+            process = context.Process(target=run_workers, args=(directory, mode, n_workers, transactions, results))
+            process.start()
+            samples = [results.get() for _ in range(n_workers)]
+            process.join()
+            mean = {key: np.mean([sample[key] for sample in samples]) / 1024 for key in samples[0]}
+            print(f"{name:<40} | RSS {mean['rss']:7.1f} MB | PSS {mean['pss']:7.1f} MB | unique {mean['uss']:7.1f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+def main():
+    """Main function"""
+    print("FraudShield Performance Benchmarks")
+    print("==================================")
+
+    benchmarks = {
+        'single': benchmark_single,
+        'forest': benchmark_forest,
+        'fold': benchmark_fold,
+        'ingest': benchmark_ingest,
+        'startup': benchmark_startup,
+        'encode': benchmark_encode,
+        'explain': benchmark_explain,
+        'backends': benchmark_backends,
+        'incremental': benchmark_incremental,
+        'hotswap': benchmark_hotswap,
+        'shadow': benchmark_shadow,
+        'cache': benchmark_cache,
+        'users': benchmark_users,
+        'demo_users': benchmark_demo_users,
+        'logins': benchmark_logins,
+    }
+
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print("\nUsage:")
+        print("  python benchmark.py <benchmark>")
+        print("\nBenchmarks:")
+        print("  single   - Single transaction feature preparation and prediction latency")
+        print("  forest   - sklearn vs. compiled forest inference for batch sizes 1 to 100k")
+        print("  fold     - Check the scaler-folded forest against the scaled pipeline (fails on any mismatch)")
+        print("  ingest   - Check streaming a CSV with blank and unparseable timestamps (fails on missing hours)")
+        print("  startup  - Cold-start time and per-worker memory of the model artifacts")
+        print("  encode   - LabelEncoder vs. lookup-table categorical encoding for batch sizes 1 to 1M")
+        print("  explain  - Cost of per-feature attributions relative to scoring")
+        print("  backends - Training time, model size, latency and PR-AUC of every model backend")
+        print("  incremental - Full retrain vs. warm-start update on newly labeled transactions")
+        print("  hotswap  - Single transaction latency while model bundles are swapped in")
+        print("  shadow   - Single transaction latency with candidate-model shadow scoring")
+        print("  cache    - Single transaction latency with the prediction cache and repeated requests")
+        print("  users    - Supabase round trips per login/profile page against a mock server")
+        print("  demo_users - Demo-mode profile update latency and memory for up to 100k registered users")
+        print("  logins   - /predict throughput during a burst of scrypt logins")
+        return
+
+    benchmarks[sys.argv[1]]()
+
+if __name__ == "__main__":
+    main()
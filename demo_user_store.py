@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class DemoUserStore:
+    """Demo-mode user records, indexed by email and by id, with at most max_users in memory
+
+    When more than max_users are held, the least recently used one is
+    evicted. Without a path that forgets the account. With a path, every
+    write also goes to a SQLite file there. Memory then acts as an LRU cache
+    over the file, and accounts survive evictions and restarts. Each worker
+    process opens its own connection. A worker may keep serving its copy of
+    a record another worker has updated until that copy is evicted.
+    """
+
+    def __init__(self, max_users=10000, path=None):
+        self.max_users = max_users
+        self.path = path
+        self.evictions = 0
+        self.db_reads = 0
+        # email -> record, least recently used first; id -> email
+        self._users = OrderedDict()
+        self._emails_by_id = {}
+        self._db = None
+        self._db_pid = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._users)
+
+    def _connection(self):
+        # A SQLite connection must not be carried across the fork into gunicorn workers
+        if self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, email TEXT UNIQUE, data TEXT)')
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _remember(self, user):
+        self._users[user['email']] = user
+        self._users.move_to_end(user['email'])
+        self._emails_by_id[user['id']] = user['email']
+        while len(self._users) > self.max_users:
+            _, evicted = self._users.popitem(last=False)
+            del self._emails_by_id[evicted['id']]
+            self.evictions += 1
+        return user
+
+    def _forget(self, user):
+        self._users.pop(user['email'], None)
+        self._emails_by_id.pop(user['id'], None)
+
+    def _read(self, column, value):
+        """Record from the SQLite file, kept in memory from then on, or None"""
+        if not self.path:
+            return None
+        self.db_reads += 1
+        row = self._connection().execute(f'SELECT data FROM users WHERE {column} = ?', (value,)).fetchone()
+        return self._remember(json.loads(row[0])) if row else None
+
+    def _write(self, user):
+        if self.path:
+            db = self._connection()
+            with db:
+                db.execute('INSERT OR REPLACE INTO users (id, email, data) VALUES (?, ?, ?)',
+                           (user['id'], user['email'], json.dumps(user)))
+
+    def get_by_email(self, email):
+        with self._lock:
+            user = self._users.get(email)
+            if user is None:
+                return self._read('email', email)
+            self._users.move_to_end(email)
+            return user
+
+    def get_by_id(self, user_id):
+        with self._lock:
+            email = self._emails_by_id.get(user_id)
+            if email is None:
+                return self._read('id', user_id)
+            return self.get_by_email(email)
+
+    def add(self, user):
+        """Store a new or replaced user record"""
+        with self._lock:
+            previous = self._users.get(user['email'])
+            if previous is not None:
+                self._forget(previous)
+            self._write(user)
+            return self._remember(user)
+
+    def update(self, user_id, data):
+        """Apply data to the user with this id; the updated record, or None if there is none"""
+        with self._lock:
+            user = self.get_by_id(user_id)
+            if user is None:
+                return None
+            self._forget(user)
+            user.update(data)
+            self._write(user)
+            return self._remember(user)
+
+    def stats(self):
+        return {
+            'users_in_memory': len(self._users),
+            'max_users': self.max_users,
+            'evictions': self.evictions,
+            'db_reads': self.db_reads,
+            'persistent': bool(self.path)
+        }
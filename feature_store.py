@@ -0,0 +1,292 @@
+import hashlib
+import mmap
+import os
+import threading
+import time
+import numpy as np
+from metrics import SharedCounters, SharedLock
+
+
+def key_hash(key):
+    """Stable 63-bit hash of a key, never one of the reserved slot markers"""
+    h = int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), 'little') >> 1
+    return h if h > DecayedCounter.DELETED else h + 2
+
+
+class DecayedCounter:
+    """Exponentially decayed event counts for a set of keys, in shared memory
+
+    Keys are hashed to 63-bit integers and kept in an open-addressing table
+    in an anonymous shared mapping, so when it is created before gunicorn
+    forks (preload_app) every worker counts into the same table. Adding an
+    event or reading a count is O(1) whatever the number of keys. The table
+    holds at most max_load * capacity keys. While it is full, events for new
+    keys are dropped; prune() frees the slots of keys whose count has decayed
+    below prune_below. It scans the whole table, so it is left to the caller
+    to run it off the request path. Callers serialize access.
+    """
+
+    EMPTY = 0
+    DELETED = 1
+
+    def __init__(self, half_life, capacity=1024, max_load=0.75, prune_below=0.01):
+        self.half_life = half_life
+        self.capacity = 1 << max(capacity - 1, 1).bit_length()
+        self.max_load = max_load
+        self.prune_below = prune_below
+        # Header: live keys, deleted slots, events dropped because the table was full
+        self._buffer = mmap.mmap(-1, (3 + 3 * self.capacity) * 8)
+        self._header = np.frombuffer(self._buffer, dtype=np.int64, count=3)
+        self.keys = np.frombuffer(self._buffer, dtype=np.int64, count=self.capacity, offset=3 * 8)
+        self.counts = np.frombuffer(self._buffer, dtype=np.float64, count=self.capacity, offset=(3 + self.capacity) * 8)
+        self.stamps = np.frombuffer(self._buffer, dtype=np.float64, count=self.capacity,
+                                    offset=(3 + 2 * self.capacity) * 8)
+        # Memoryviews of the same cells for single-key access, which is several times faster than NumPy indexing
+        view = memoryview(self._buffer)
+        self._keys = view[3 * 8:(3 + self.capacity) * 8].cast('q')
+        self._counts = view[(3 + self.capacity) * 8:(3 + 2 * self.capacity) * 8].cast('d')
+        self._stamps = view[(3 + 2 * self.capacity) * 8:].cast('d')
+
+    def __len__(self):
+        return int(self._header[0])
+
+    @property
+    def dropped(self):
+        return int(self._header[2])
+
+    def _find(self, h):
+        """(slot, found): the slot holding h, or the one to insert it into (-1 if none)"""
+        mask = self.capacity - 1
+        i = h & mask
+        insert_at = -1
+        for _ in range(self.capacity):
+            key = self._keys[i]
+            if key == h:
+                return i, True
+            if key == self.EMPTY:
+                return (i if insert_at < 0 else insert_at), False
+            if key == self.DELETED and insert_at < 0:
+                insert_at = i
+            i = (i + 1) & mask
+        return insert_at, False
+
+    def _insert(self, h, count, stamp):
+        i, found = self._find(h)
+        if not found:
+            if len(self) >= self.max_load * self.capacity:
+                return -1
+            if self._keys[i] == self.DELETED:
+                self._header[1] -= 1
+            self._keys[i] = h
+            self._header[0] += 1
+        self._counts[i] = count
+        self._stamps[i] = stamp
+        return i
+
+    def _decay(self, i, now):
+        # Workers may record events slightly out of order; never decay backwards
+        return self._counts[i] * 2.0 ** (-max(0.0, now - self._stamps[i]) / self.half_life)
+
+    def add(self, key, now, weight=1.0):
+        """Count an event for key at time now and return the key's new count (None if the table is full)"""
+        h = key_hash(key)
+        i, found = self._find(h)
+        if not found:
+            i = self._insert(h, 0.0, now)
+            if i < 0:
+                self._header[2] += 1
+                return None
+        count = self._decay(i, now) + weight
+        self._counts[i] = count
+        self._stamps[i] = max(now, self._stamps[i])
+        return count
+
+    def get(self, key, now):
+        """Decayed count of key at time now (0 for unseen keys)"""
+        i, found = self._find(key_hash(key))
+        return self._decay(i, now) if found else 0.0
+
+    def prune(self, now):
+        """Forget keys whose decayed count is below prune_below; returns how many"""
+        live = self.keys > self.DELETED
+        decayed = self.counts * 2.0 ** (-np.maximum(0.0, now - self.stamps) / self.half_life)
+        stale = live & (decayed < self.prune_below)
+        n_stale = int(np.count_nonzero(stale))
+        self.keys[stale] = self.DELETED
+        self._header[0] -= n_stale
+        self._header[1] += n_stale
+        if self._header[1] > self.capacity // 4:
+            # Too many deleted slots lengthen every probe; rebuild the table without them
+            self.restore(*self.state())
+        return n_stale
+
+    def state(self):
+        live = self.keys > self.DELETED
+        return self.keys[live].copy(), self.counts[live].copy(), self.stamps[live].copy()
+
+    def restore(self, keys, counts, stamps):
+        if keys.dtype.kind in 'US':
+            # Snapshots from before the shared table stored the keys themselves
+            keys = np.array([key_hash(key) for key in keys.tolist()], dtype=np.int64)
+        self.keys[:] = self.EMPTY
+        self._header[:2] = 0
+        for h, count, stamp in zip(keys.tolist(), counts.tolist(), stamps.tolist()):
+            self._insert(h, count, stamp)
+
+
+class FeatureStore:
+    """Server-side transaction_frequency and location_risk_score
+
+    Every scored transaction that names a customer_id or location updates
+    time-decayed counters, and the features are filled in from them the way
+    process_real_data derives them from a whole dataset: the customer's
+    (decayed) number of transactions, and a risk score that rises as a
+    location's share of all transactions falls. The store snapshots to an
+    .npz file in the background so a restart does not start cold.
+
+    The counters live in shared memory, so a store created before gunicorn
+    forks its workers counts every worker's transactions, as the dataset
+    features do. Any worker's snapshot therefore holds the full state. Up to
+    capacity customers are tracked; those not seen for about seven half-lives
+    are dropped every snapshot_interval seconds, by a background thread. While
+    the table is full, a new customer's or location's feature is left unset,
+    so the client's value stands.
+
+    A client retrying a request sends the same idempotency key again.
+    Requests whose idempotency_key was already seen in the last retry_window
+    seconds read the counts without adding to them, so a retry neither
+    inflates the customer's frequency nor changes the features it is scored
+    with. Requests without a key are always counted: identical transactions
+    in quick succession are a velocity signal, not retries. Up to
+    retry_capacity keys are remembered; expired ones are forgotten every
+    retry_window seconds.
+    """
+
+    def __init__(self, half_life_hours=168, min_location_events=100, path=None, snapshot_interval=300, capacity=2**18,
+                 retry_window=60.0, retry_capacity=2**16):
+        self.half_life = half_life_hours * 3600.0
+        # Location shares are meaningless until enough transactions have been seen
+        self.min_location_events = min_location_events
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.retry_window = retry_window
+        self.customers = DecayedCounter(self.half_life, capacity)
+        self.locations = DecayedCounter(self.half_life, max(1024, capacity // 64))
+        self.total = DecayedCounter(self.half_life, capacity=2)
+        # A key's count halves every retry_window seconds, so it is at least 0.5 within one window
+        self.requests = DecayedCounter(retry_window, retry_capacity, prune_below=0.5)
+        # Shared by all workers, and released by the kernel if a worker holding it is killed
+        self._lock = SharedLock()
+        self.counters = SharedCounters(['retries'])
+        self._last_snapshot = time.time()
+        self._last_maintenance = time.time()
+        self._maintenance_running = False
+
+    def observe(self, customer_id=None, location=None, now=None, idempotency_key=None):
+        """Record a transaction and return the features the store can supply for it"""
+        if customer_id is None and location is None:
+            return {}
+        now = time.time() if now is None else now
+        features = {}
+
+        with self._lock:
+            retry = False
+            if idempotency_key is not None:
+                seen = self.requests.get(idempotency_key, now)
+                retry = seen >= 0.5
+                if retry:
+                    self.counters.add('retries')
+                else:
+                    # Start the key's window afresh at a count of exactly 1
+                    self.requests.add(idempotency_key, now, weight=1.0 - seen)
+
+            def tally(counter, key):
+                return counter.get(key, now) if retry else counter.add(key, now)
+
+            total = tally(self.total, '')
+            if customer_id is not None:
+                frequency = tally(self.customers, str(customer_id))
+                if frequency:
+                    features['transaction_frequency'] = max(1, int(round(frequency)))
+            if location is not None:
+                count = tally(self.locations, str(location))
+                if count and total >= self.min_location_events:
+                    # Same formula as process_real_data, over decayed counts
+                    features['location_risk_score'] = min(0.9, 1.0 - (count / total * 10))
+
+        if now - self._last_maintenance >= min(self.retry_window, self.snapshot_interval):
+            self._maintain_in_background()
+        return features
+
+    def stats(self):
+        """Sizes of the store for /stats"""
+        now = time.time()
+        return {
+            'customers': len(self.customers),
+            'locations': len(self.locations),
+            'capacity': self.customers.capacity,
+            'dropped_events': self.customers.dropped + self.locations.dropped,
+            'idempotency_keys': len(self.requests),
+            'dropped_idempotency_keys': self.requests.dropped,
+            'retries': self.counters.total('retries'),
+            'decayed_transactions': round(self.total.get('', now), 2),
+            'half_life_hours': self.half_life / 3600.0
+        }
+
+    def _maintain_in_background(self):
+        with self._lock:
+            if self._maintenance_running:
+                return
+            self._maintenance_running = True
+            self._last_maintenance = time.time()
+        threading.Thread(target=self._maintain, name='feature-store-maintenance', daemon=True).start()
+
+    def _maintain(self):
+        """Forget expired idempotency keys, and snapshot when one is due"""
+        try:
+            now = time.time()
+            with self._lock:
+                self.requests.prune(now)
+            if now - self._last_snapshot >= self.snapshot_interval:
+                self._last_snapshot = now
+                self.save()
+        finally:
+            self._maintenance_running = False
+
+    def save(self, path=None):
+        """Forget decayed keys and write the store to an .npz snapshot atomically"""
+        path = path or self.path
+        try:
+            now = time.time()
+            with self._lock:
+                arrays = {}
+                for name, counter in [('customers', self.customers), ('locations', self.locations), ('total', self.total)]:
+                    counter.prune(now)
+                    arrays[f'{name}_keys'], arrays[f'{name}_counts'], arrays[f'{name}_stamps'] = counter.state()
+            if not path or not len(self.total):
+                return
+            # Workers may snapshot at the same time; each writes its own temporary file
+            tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+            np.savez(tmp_path, half_life=self.half_life, **arrays)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error saving feature store: {e}")
+
+    def load(self, path=None):
+        """Restore the store from a snapshot; returns False if there is none"""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as snapshot:
+                if float(snapshot['half_life']) != self.half_life:
+                    print("Feature store snapshot uses a different half-life; starting empty")
+                    return False
+                with self._lock:
+                    for name, counter in [('customers', self.customers), ('locations', self.locations), ('total', self.total)]:
+                        counter.restore(snapshot[f'{name}_keys'], snapshot[f'{name}_counts'], snapshot[f'{name}_stamps'])
+            print(f"Feature store loaded: {len(self.customers)} customers, {len(self.locations)} locations")
+            return True
+        except Exception as e:
+            print(f"Error loading feature store: {e}")
+            return False
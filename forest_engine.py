@@ -0,0 +1,189 @@
+import numpy as np
+
+# Marker sklearn uses for missing children on leaf nodes
+TREE_LEAF = -1
+
+
+class CompiledForest:
+    """Random forest flattened into contiguous NumPy node arrays"""
+
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, max_depth,
+                 input_dtype=np.float32, folded=False):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        # sklearn casts inputs to float32 before comparing them with the float64 thresholds
+        self.input_dtype = input_dtype
+        # True when thresholds are in raw (unscaled) feature units
+        self.folded = folded
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Export a fitted RandomForestClassifier into flat node arrays"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        n_classes = model.n_classes_
+        offset = 0
+        max_depth = 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == TREE_LEAF
+
+            # Leaves point at themselves so the level-by-level walk can run a fixed number of steps
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            values.append(tree.value[:, 0, :n_classes])
+            roots.append(offset)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            children_left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            children_right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+        )
+
+    def fold_scaler(self, mean, scale):
+        """Return a copy whose thresholds are in raw feature units
+
+        The forest was fitted on float32((x - mean) / scale). That expression
+        is monotonic in x, so each split t has a largest raw value that still
+        goes left; it is found by bisection, which makes the folded forest
+        route every input exactly as the scaled pipeline does.
+        """
+        mean = np.asarray(mean, dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
+        threshold = self.threshold.copy()
+
+        split = np.isfinite(threshold)
+        node_mean = mean[self.feature[split]]
+        node_scale = scale[self.feature[split]]
+        node_threshold = threshold[split]
+
+        def goes_left(x):
+            # Same arithmetic as StandardScaler.transform followed by sklearn's float32 cast
+            return ((x - node_mean) / node_scale).astype(np.float32) <= node_threshold
+
+        # Bracket the boundary around the naive estimate, widening until lo goes left and hi goes right
+        estimate = node_threshold * node_scale + node_mean
+        width = np.maximum(np.abs(estimate), node_scale) * 1e-6
+        lo, hi = estimate - width, estimate + width
+        while True:
+            bad_lo, bad_hi = ~goes_left(lo), goes_left(hi)
+            if not (bad_lo.any() or bad_hi.any()):
+                break
+            width *= 16
+            lo = np.where(bad_lo, estimate - width, lo)
+            hi = np.where(bad_hi, estimate + width, hi)
+
+        # Bisect until lo and hi are adjacent doubles
+        while True:
+            mid = lo + (hi - lo) / 2
+            active = (mid != lo) & (mid != hi)
+            if not active.any():
+                break
+            left = goes_left(mid)
+            lo = np.where(active & left, mid, lo)
+            hi = np.where(active & ~left, mid, hi)
+
+        threshold[split] = lo
+        return CompiledForest(
+            feature=self.feature,
+            threshold=threshold,
+            children_left=self.children_left,
+            children_right=self.children_right,
+            value=self.value,
+            roots=self.roots,
+            max_depth=self.max_depth,
+            input_dtype=np.float64,
+            folded=True,
+        )
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_trees, n_samples)"""
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        n_samples, n_features = X.shape
+
+        # Row offsets into the flattened input, broadcast against the tree axis
+        row_offsets = (np.arange(n_samples, dtype=np.intp) * n_features)[np.newaxis, :]
+        flat_X = X.ravel()
+
+        nodes = np.repeat(self.roots[:, np.newaxis], n_samples, axis=1)
+        for _ in range(self.max_depth):
+            x = flat_X[row_offsets + self.feature[nodes]]
+            nodes = np.where(x <= self.threshold[nodes], self.children_left[nodes], self.children_right[nodes])
+        return nodes
+
+    def predict_proba(self, X, block_size=1024):
+        """Class probabilities, bit-identical to RandomForestClassifier.predict_proba"""
+        n_samples = len(X)
+        proba = np.empty((n_samples, self.value.shape[1]), dtype=np.float64)
+
+        # Score in blocks so the (n_trees, block) index arrays stay cache sized
+        for start in range(0, n_samples, block_size):
+            stop = min(start + block_size, n_samples)
+            leaf_values = self.value[self.apply(X[start:stop])]
+            # Accumulate tree by tree in estimator order, then average, as sklearn does
+            block = proba[start:stop]
+            block[...] = 0.0
+            for tree_values in leaf_values:
+                block += tree_values
+            block /= self.n_trees
+
+        return proba
+
+    def contributions(self, X, class_index=1, block_size=1024):
+        """Saabas feature contributions to the probability of class_index
+
+        Every split on a sample's path moves the node value from parent to
+        child; that change is credited to the split's feature. Averaged over
+        the trees, bias + contributions.sum(axis=1) equals predict_proba.
+        Returns bias of shape (n_samples,) and contributions of shape
+        (n_samples, n_features).
+        """
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        n_samples, n_features = X.shape
+        node_value = np.ascontiguousarray(self.value[:, class_index])
+        bias = np.full(n_samples, node_value[self.roots].mean())
+        contributions = np.empty((n_samples, n_features), dtype=np.float64)
+
+        for start in range(0, n_samples, block_size):
+            stop = min(start + block_size, n_samples)
+            block = stop - start
+            flat_X = X[start:stop].ravel()
+            row_offsets = (np.arange(block, dtype=np.intp) * n_features)[np.newaxis, :]
+
+            # Same level walk as apply, also crediting each step's value change to its feature
+            totals = np.zeros(block * n_features, dtype=np.float64)
+            nodes = np.repeat(self.roots[:, np.newaxis], block, axis=1)
+            for _ in range(self.max_depth):
+                cells = row_offsets + self.feature[nodes]
+                next_nodes = np.where(flat_X[cells] <= self.threshold[nodes],
+                                      self.children_left[nodes], self.children_right[nodes])
+                # Leaves point at themselves, so finished paths add zero
+                totals += np.bincount(cells.ravel(), weights=(node_value[next_nodes] - node_value[nodes]).ravel(),
+                                      minlength=block * n_features)
+                nodes = next_nodes
+            contributions[start:stop] = totals.reshape(block, n_features) / self.n_trees
+
+        return bias, contributions
@@ -0,0 +1,15 @@
+# Gunicorn configuration, picked up automatically from the working directory
+import gc
+import os
+
+# Import app.py once in the master so the model is loaded before workers are forked
+preload_app = True
+
+
+def when_ready(server):
+    """Load the model bundle in the master so every forked worker shares its pages"""
+    from app import fraud_detector
+    fraud_detector.preload(fold_scaler=os.getenv('FOLD_SCALER', 'false').lower() == 'true')
+
+    # Stop the garbage collector from writing to (and un-sharing) the preloaded objects
+    gc.freeze()
@@ -0,0 +1,236 @@
+import glob
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    # The processed-data cache and Parquet inputs are skipped without pyarrow
+    pa = None
+
+# Training data files picked up from the data directory
+DATA_FILE_PATTERNS = ['*.csv', '*.csv.gz', '*.parquet']
+
+# Compact dtypes for the standard columns produced by FraudDetector.map_column_names
+COMPACT_DTYPES = {
+    'amount': 'float32',
+    'hour': 'int8',
+    'merchant_category': 'category',
+    'payment_method': 'category',
+    'customer_age': 'float32',
+    'transaction_frequency': 'int32',
+    'location_risk_score': 'float32',
+    'location': 'category',
+    'customer_id': 'category',
+    'is_fraud': 'int8'
+}
+
+# Raw string columns are read as categories so a chunk holds each distinct value once
+READ_DTYPES = {
+    'merchant_category': 'category',
+    'payment_method': 'category',
+    'location': 'category',
+    'customer_id': 'category',
+    'transaction_time': 'category'
+}
+
+
+def compact_frame(df):
+    """Downcast the standard columns of df to COMPACT_DTYPES"""
+    dtypes = {col: dtype for col, dtype in COMPACT_DTYPES.items() if col in df.columns}
+    for col, dtype in dtypes.items():
+        # An integer column cannot hold NaN; keep such a column as floats rather than fail the load
+        if dtype.startswith('int') and df[col].isna().any():
+            dtypes[col] = 'float32'
+    return df.astype(dtypes)
+
+
+def find_data_files(directory):
+    """Every training data file in directory, in name order"""
+    patterns = DATA_FILE_PATTERNS if pa is not None else [p for p in DATA_FILE_PATTERNS if p != '*.parquet']
+    return sorted({path for pattern in patterns for path in glob.glob(os.path.join(directory, pattern))})
+
+
+def read_chunks(path, map_column_names, columns, chunksize=100000):
+    """Stream a CSV (optionally gzipped) or Parquet file in chunks
+
+    Only the raw columns that map onto columns are read. map_column_names is
+    applied to the header once; each chunk comes back already renamed, with
+    the string columns as categories.
+    """
+    parquet = path.endswith('.parquet')
+    names = pq.read_schema(path).names if parquet else pd.read_csv(path, nrows=0).columns
+    mapped = map_column_names(pd.DataFrame(columns=names)).columns
+
+    # Several raw names may map onto one standard column; the first one wins
+    rename, usecols, dtypes = {}, [], {}
+    for raw, name in zip(names, mapped):
+        if name in columns and name not in rename.values():
+            rename[raw] = name
+            usecols.append(raw)
+            if name in READ_DTYPES:
+                dtypes[raw] = READ_DTYPES[name]
+
+    if parquet:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=usecols):
+            chunk = batch.to_pandas()
+            for raw in dtypes:
+                # Parquet keeps native types; ids and labels are compared as strings like CSV values
+                values = chunk[raw]
+                chunk[raw] = values.where(values.isna(), values.astype(str)).astype('category')
+            yield chunk.rename(columns=rename)
+    else:
+        for chunk in pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunksize):
+            yield chunk.rename(columns=rename)
+
+
+class StratifiedReservoir:
+    """Uniform reservoir sample of each class of a stream of DataFrame chunks
+
+    Every stratum keeps a reservoir (Algorithm R) of up to capacity rows, so
+    memory stays bounded however long the stream is. sample() then draws
+    from each stratum in proportion to how often it occurred in the stream.
+    """
+
+    def __init__(self, capacity, strata_column='is_fraud', random_state=42):
+        self.capacity = capacity
+        self.strata_column = strata_column
+        self.rng = np.random.default_rng(random_state)
+        self.reservoirs = {}
+        self.seen = {}
+
+    @property
+    def total_seen(self):
+        return sum(self.seen.values())
+
+    def add(self, chunk):
+        """Offer every row of chunk to the reservoir of its stratum"""
+        for stratum, rows in chunk.groupby(self.strata_column, sort=False, observed=True, dropna=False):
+            self._add_stratum(stratum, rows.reset_index(drop=True))
+
+    def _add_stratum(self, stratum, rows):
+        reservoir = self.reservoirs.get(stratum)
+        seen = self.seen.get(stratum, 0)
+        self.seen[stratum] = seen + len(rows)
+
+        # Fill the reservoir until it holds capacity rows
+        free = self.capacity - (0 if reservoir is None else len(reservoir))
+        if free > 0:
+            head = rows.iloc[:free]
+            reservoir = head if reservoir is None else pd.concat([reservoir, head], ignore_index=True)
+            rows = rows.iloc[free:]
+            seen += len(head)
+        if len(rows) == 0:
+            self.reservoirs[stratum] = reservoir
+            return
+
+        # Row number i (1-based) in the stream replaces a random slot with probability capacity / i
+        positions = np.arange(seen + 1, seen + len(rows) + 1)
+        slots = (self.rng.random(len(rows)) * positions).astype(np.int64)
+        replacing = np.flatnonzero(slots < self.capacity)
+
+        # When several rows land on the same slot the last one wins, as in the sequential algorithm
+        reversed_slots = slots[replacing][::-1]
+        slots, last = np.unique(reversed_slots, return_index=True)
+        winners = replacing[::-1][last]
+
+        kept = np.ones(len(reservoir), dtype=bool)
+        kept[slots] = False
+        self.reservoirs[stratum] = pd.concat(
+            [reservoir[kept], rows.iloc[winners]], ignore_index=True
+        )
+
+    def merge(self, other):
+        """Fold in a reservoir built over a different part of the stream
+
+        For each stratum, the number of rows taken from each side follows the
+        hypergeometric distribution of a uniform draw from both parts, so the
+        merged reservoir is again a uniform sample of everything seen.
+        """
+        for stratum, theirs in other.reservoirs.items():
+            ours = self.reservoirs.get(stratum)
+            seen, other_seen = self.seen.get(stratum, 0), other.seen[stratum]
+            self.seen[stratum] = seen + other_seen
+            if ours is None:
+                self.reservoirs[stratum] = theirs
+                continue
+
+            size = min(self.capacity, seen + other_seen)
+            from_other = self.rng.hypergeometric(other_seen, seen, size)
+            ours = ours.iloc[self.rng.choice(len(ours), size - from_other, replace=False)]
+            theirs = theirs.iloc[self.rng.choice(len(theirs), from_other, replace=False)]
+            self.reservoirs[stratum] = pd.concat([ours, theirs], ignore_index=True)
+
+    def sample(self, n=None):
+        """Stratified sample of up to n rows (default capacity), proportional to the stream"""
+        n = self.capacity if n is None else n
+        total = self.total_seen
+        parts = []
+        for stratum, reservoir in self.reservoirs.items():
+            # Keep at least one row of every stratum that occurred
+            share = max(1, int(round(n * self.seen[stratum] / total)))
+            share = min(share, len(reservoir))
+            picked = self.rng.choice(len(reservoir), size=share, replace=False)
+            parts.append(reservoir.iloc[np.sort(picked)])
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True)
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ProcessedDataCache:
+    """On-disk Arrow IPC cache of processed training data
+
+    Entries are keyed by the SHA-256 of the source files, the preprocessing
+    version and any extra parameters that shape the output, so editing the
+    file or the preprocessing code never serves stale rows. Files are
+    written uncompressed with categoricals dictionary-encoded, which lets
+    them be memory-mapped straight back into a DataFrame. The cache lives
+    in a .cache directory next to the (first) source file.
+    """
+
+    def __init__(self, version):
+        self.version = version
+
+    @property
+    def enabled(self):
+        return pa is not None
+
+    def path_for(self, sources, **params):
+        """Cache file for sources processed together with params"""
+        if isinstance(sources, str):
+            sources = [sources]
+        directory, name = os.path.split(sources[0])
+        stem = name.split('.')[0] + (f'+{len(sources) - 1}' if len(sources) > 1 else '')
+        digest = hashlib.sha256(''.join(file_digest(source) for source in sources).encode()).hexdigest()
+        extra = ''.join(f'-{key}{value}' for key, value in sorted(params.items()))
+        return os.path.join(directory, '.cache', f'{stem}-{digest[:16]}-v{self.version}{extra}.arrow')
+
+    def load(self, path):
+        """Memory-map a cached DataFrame, or return None if it is missing"""
+        if not self.enabled or not os.path.exists(path):
+            return None
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.to_pandas()
+
+    def store(self, path, df):
+        """Write df to the cache atomically"""
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        feather.write_feather(df.reset_index(drop=True), tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
@@ -0,0 +1,285 @@
+import cProfile
+import fcntl
+import mmap
+import os
+import random
+import tempfile
+import threading
+import weakref
+import numpy as np
+
+
+class SharedLock:
+    """Lock excluding all threads of every process forked after it was created
+
+    It is a POSIX record lock on an unlinked temporary file, which the
+    kernel releases if its holder is killed, so a SIGKILLed worker cannot
+    leave the others blocked. Record locks only exclude other processes,
+    so each process also has a thread lock of its own.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._thread_lock = threading.Lock()
+        # A child must not inherit a thread lock some other parent thread held at fork time
+        reset = weakref.WeakMethod(self._reset)
+        os.register_at_fork(after_in_child=lambda: reset() and reset()())
+
+    def _reset(self):
+        self._thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fcntl.lockf(self._file, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.lockf(self._file, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+
+class RowLease:
+    """Marks a thread's hold on a SharedTable row; its finalizer frees the row"""
+
+
+class SharedTable:
+    """Per-thread rows of int64 cells in a shared memory segment
+
+    Each thread leases a row of its own and writes it without any locking;
+    readers sum all rows. The segment is an anonymous shared mapping, so
+    when it is created before gunicorn forks (preload_app) every worker
+    writes into the same table and any worker can report global totals.
+
+    A row stays with the process that claimed it. When a thread exits, its
+    row goes back to that process's free list with its totals in place, and
+    the next new thread continues it, so thread-per-request servers need
+    only as many rows as they have concurrent threads. Claiming a new row
+    takes a SharedLock. When the table is full, rows of exited workers are
+    folded into the last row and reused. Only while every row is owned by a
+    live thread do further threads write the last row, under that lock.
+    """
+
+    def __init__(self, n_columns, slots=1024):
+        # Column 0 holds the pid owning the row (0 = free); the last row collects reclaimed and overflow counts
+        self._buffer = mmap.mmap(-1, slots * (n_columns + 1) * 8)
+        self._table = np.frombuffer(self._buffer, dtype=np.int64).reshape(slots, n_columns + 1)
+        # Guards claims and the last row
+        self._lock = SharedLock()
+        self._local = threading.local()
+        # (pid, rows this process has claimed but no thread holds)
+        self._process = (None, [])
+
+    def _free_rows(self):
+        # A forked child must not reuse the parent's free rows
+        pid = os.getpid()
+        if self._process[0] != pid:
+            self._process = (pid, [])
+        return self._process[1]
+
+    def _thread_row(self):
+        """Return this thread's row and whether it is the shared last row"""
+        local = self._local
+        pid = os.getpid()
+        # A forked child inherits the parent's thread-local state, so leases are tied to a pid
+        if getattr(local, 'pid', None) != pid:
+            local.row, local.shared = self._lease_row(pid)
+            local.pid = pid
+        return local.row, local.shared
+
+    def _lease_row(self, pid):
+        free = self._free_rows()
+        try:
+            index = free.pop()
+        except IndexError:
+            index = self._claim_row(pid)
+        if index is None:
+            return self._table[-1], True
+        # The thread's local storage, and the lease with it, is dropped when the thread exits
+        self._local.lease = lease = RowLease()
+        weakref.finalize(lease, free.append, index)
+        return self._table[index], False
+
+    def _claim_row(self, pid):
+        with self._lock:
+            free = np.flatnonzero(self._table[:-1, 0] == 0)
+            if not len(free):
+                self._reclaim_exited()
+                free = np.flatnonzero(self._table[:-1, 0] == 0)
+            if len(free):
+                index = free[0]
+                self._table[index, 0] = pid
+                return index
+        return None
+
+    def _reclaim_exited(self):
+        """Fold the rows of processes that no longer exist into the last row and free them"""
+        table = self._table
+        for owner in np.unique(table[:-1, 0]):
+            if owner == 0:
+                continue
+            try:
+                os.kill(int(owner), 0)
+            except ProcessLookupError:
+                rows = np.flatnonzero(table[:-1, 0] == owner)
+                table[-1, 1:] += table[rows, 1:].sum(axis=0)
+                table[rows] = 0
+            except PermissionError:
+                pass
+
+    def add(self, column, value=1):
+        """Add value to a cell of the calling thread's row (columns start at 1)"""
+        row, shared = self._thread_row()
+        if not shared:
+            row[column] += value
+        else:
+            with self._lock:
+                row[column] += value
+
+    def sums(self):
+        """Column totals across all threads and worker processes"""
+        # Only read claimed rows (plus the last row) so untouched pages stay unmapped
+        claimed = self._table[:, 0] != 0
+        claimed[-1] = True
+        return self._table[claimed, 1:].sum(axis=0)
+
+
+class SharedCounters:
+    """Named counters merged across threads and forked workers"""
+
+    def __init__(self, names, slots=1024):
+        self.names = list(names)
+        self._columns = {name: i + 1 for i, name in enumerate(self.names)}
+        self._table = SharedTable(len(self.names), slots)
+
+    def add(self, name, value=1):
+        """Increment a counter from the calling thread"""
+        self._table.add(self._columns[name], value)
+
+    def totals(self):
+        """Sum every row across all threads and worker processes"""
+        return {name: int(total) for name, total in zip(self.names, self._table.sums())}
+
+    def total(self, name):
+        return self.totals()[name]
+
+
+class LatencyHistograms:
+    """HDR-style log-linear latency histograms, one per pipeline stage
+
+    Latencies are recorded in microseconds into buckets that split every
+    power of two into SUB_BUCKETS linear steps, so any recorded value is
+    known to within 1/SUB_BUCKETS of itself from 1 us up to about a minute.
+    """
+
+    SUB_BUCKETS = 8
+    MAX_MICROSECONDS = 60_000_000
+
+    def __init__(self, stages, slots=128):
+        self.stages = list(stages)
+        self.n_buckets = self._bucket(self.MAX_MICROSECONDS) + 1
+        # Per stage: the bucket counts followed by the sum of latencies in nanoseconds
+        self._width = self.n_buckets + 1
+        self._offsets = {stage: 1 + i * self._width for i, stage in enumerate(self.stages)}
+        self._table = SharedTable(len(self.stages) * self._width, slots)
+
+    @classmethod
+    def _bucket(cls, microseconds):
+        if microseconds < cls.SUB_BUCKETS:
+            return microseconds
+        shift = microseconds.bit_length() - cls.SUB_BUCKETS.bit_length()
+        return cls.SUB_BUCKETS * shift + (microseconds >> shift)
+
+    def upper_bound(self, bucket):
+        """Exclusive upper bound of a bucket, in microseconds"""
+        shift = max(0, bucket // self.SUB_BUCKETS - 1)
+        return (bucket - self.SUB_BUCKETS * shift + 1) << shift
+
+    def record(self, stage, nanoseconds):
+        """Record one latency measured with time.perf_counter_ns"""
+        microseconds = min(nanoseconds // 1000, self.MAX_MICROSECONDS)
+        offset = self._offsets[stage]
+        self._table.add(offset + self._bucket(microseconds))
+        self._table.add(offset + self.n_buckets, nanoseconds)
+
+    def snapshot(self):
+        """Per-stage bucket counts and latency sums across all workers"""
+        sums = self._table.sums()
+        result = {}
+        for stage, offset in self._offsets.items():
+            start = offset - 1
+            counts = sums[start:start + self.n_buckets]
+            result[stage] = {
+                'counts': counts,
+                'count': int(counts.sum()),
+                'sum_seconds': sums[start + self.n_buckets] / 1e9
+            }
+        return result
+
+    def percentile(self, stage, q):
+        """Approximate latency percentile in microseconds (bucket upper bound)"""
+        counts = self.snapshot()[stage]['counts']
+        if counts.sum() == 0:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(counts), counts.sum() * q / 100.0))
+        return float(self.upper_bound(bucket))
+
+
+class SampledProfiler:
+    """Runs a sampled fraction of calls under cProfile and keeps the last captures on disk"""
+
+    def __init__(self, sample_rate, directory='profiles', max_captures=50):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.max_captures = max_captures
+        self._captures = 0
+        # Only one profiler can be active per process (on Python 3.12+ cProfile uses sys.monitoring)
+        self._capturing = threading.Lock()
+
+    def call(self, func, *args, **kwargs):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return func(*args, **kwargs)
+        # Calls sampled while another capture is running go unprofiled
+        if not self._capturing.acquire(blocking=False):
+            return func(*args, **kwargs)
+
+        try:
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(func, *args, **kwargs)
+            finally:
+                # Overwrite the oldest capture once max_captures files exist
+                os.makedirs(self.directory, exist_ok=True)
+                index = self._captures % self.max_captures
+                self._captures += 1
+                profiler.dump_stats(os.path.join(self.directory, f'predict-{os.getpid()}-{index}.prof'))
+        finally:
+            self._capturing.release()
+
+
+def render_prometheus(counters, histograms, prefix='fraudshield'):
+    """Render counters and latency histograms in the Prometheus text format"""
+    lines = []
+    for name, total in counters.items():
+        metric = f'{prefix}_{name}_total'
+        lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric} {total}')
+
+    metric = f'{prefix}_stage_latency_seconds'
+    lines.append(f'# HELP {metric} Time spent in each stage of the scoring pipeline')
+    lines.append(f'# TYPE {metric} histogram')
+    snapshot = histograms.snapshot()
+    for stage, data in snapshot.items():
+        cumulative = np.cumsum(data['counts'])
+        # Buckets above the highest non-empty one add nothing but noise
+        last = int(np.flatnonzero(data['counts'])[-1]) if data['count'] else 0
+        for bucket in range(min(last + 2, histograms.n_buckets)):
+            le = histograms.upper_bound(bucket) / 1e6
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="{le:.6g}"}} {int(cumulative[bucket])}')
+        lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {data["count"]}')
+        lines.append(f'{metric}_sum{{stage="{stage}"}} {data["sum_seconds"]:.9f}')
+        lines.append(f'{metric}_count{{stage="{stage}"}} {data["count"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,98 @@
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.ensemble import (HistGradientBoostingClassifier, IsolationForest, RandomForestClassifier,
+                              StackingClassifier)
+from sklearn.linear_model import LogisticRegression
+from tuning import DEFAULT_PARAMS
+
+# Backend name -> factory taking the backend's parameters and returning an unfitted classifier
+MODEL_BACKENDS = {}
+
+
+def register_backend(name, compilable=False):
+    """Register a model factory under name
+
+    compilable backends are Random Forests that FraudDetector exports to a
+    CompiledForest for the fast single-row path, scaler folding and
+    explanations; every other backend is scored through predict_proba.
+    """
+    def register(factory):
+        factory.compilable = compilable
+        MODEL_BACKENDS[name] = factory
+        return factory
+    return register
+
+
+def create_model(backend, params=None):
+    """Unfitted classifier for backend with params overriding its defaults"""
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}; available: {', '.join(MODEL_BACKENDS)}")
+    return MODEL_BACKENDS[backend](**(params or {}))
+
+
+def is_compilable(backend):
+    return MODEL_BACKENDS[backend].compilable
+
+
+class AnomalyScoreClassifier(ClassifierMixin, BaseEstimator):
+    """IsolationForest anomaly scores calibrated into fraud probabilities
+
+    The forest learns what normal transactions look like from the legitimate
+    rows only; a logistic regression on the anomaly score then maps it to a
+    fraud probability using the labels.
+    """
+
+    def __init__(self, n_estimators=200, max_samples='auto', random_state=42):
+        self.n_estimators = n_estimators
+        self.max_samples = max_samples
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        y = np.asarray(y)
+        self.classes_ = np.unique(y)
+        self.isolation_forest_ = IsolationForest(
+            n_estimators=self.n_estimators, max_samples=self.max_samples, random_state=self.random_state
+        ).fit(X[y == self.classes_[0]])
+        self.calibrator_ = LogisticRegression(class_weight='balanced').fit(self._anomaly_scores(X), y)
+        return self
+
+    def _anomaly_scores(self, X):
+        # score_samples is higher for normal rows; negate so larger means more anomalous
+        return -self.isolation_forest_.score_samples(X)[:, np.newaxis]
+
+    def predict_proba(self, X):
+        return self.calibrator_.predict_proba(self._anomaly_scores(X))
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+@register_backend('random_forest', compilable=True)
+def random_forest(**params):
+    return RandomForestClassifier(**{**DEFAULT_PARAMS, **params}, random_state=42, class_weight='balanced')
+
+
+@register_backend('hist_gradient_boosting')
+def hist_gradient_boosting(**params):
+    defaults = {'max_iter': 200, 'learning_rate': 0.1, 'max_leaf_nodes': 31}
+    return HistGradientBoostingClassifier(**{**defaults, **params}, random_state=42, class_weight='balanced')
+
+
+@register_backend('isolation_forest')
+def isolation_forest(**params):
+    return AnomalyScoreClassifier(**params)
+
+
+@register_backend('stacked')
+def stacked(**params):
+    """Random Forest, gradient boosting and anomaly score combined by a logistic regression"""
+    return StackingClassifier(
+        estimators=[
+            ('random_forest', random_forest(**params.get('random_forest', {}))),
+            ('hist_gradient_boosting', hist_gradient_boosting(**params.get('hist_gradient_boosting', {}))),
+            ('isolation_forest', isolation_forest(**params.get('isolation_forest', {})))
+        ],
+        final_estimator=LogisticRegression(class_weight='balanced'),
+        stack_method='predict_proba',
+        cv=3
+    )
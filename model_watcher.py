@@ -0,0 +1,143 @@
+import time
+import numpy as np
+import pandas as pd
+from sklearn.metrics import average_precision_score
+from background import background_thread
+from fraud_detector import bundle_signature
+
+
+class ModelWatcher:
+    """Swaps a new model bundle into a running FraudDetector without a restart
+
+    Every worker process runs its own watcher thread, which stats the bundle
+    file every check_interval seconds. When it changes, the new version is
+    memory-mapped and scored on a labeled canary set off the request path.
+    It is swapped in, by a single assignment of FraudDetector.state, only if
+    its probabilities are valid and its canary PR-AUC is no more than
+    max_pr_auc_drop below the active model's. Requests already in flight
+    finish on the version they started with. A rejected bundle is not tried
+    again until the file changes.
+
+    Loading and validating take a CPU for 100 ms or more, so on Linux the
+    watcher thread lowers its own scheduling priority to niceness; request
+    threads then preempt it instead of sharing the core with it.
+    """
+
+    def __init__(self, detector, check_interval=5.0, canary_path=None, canary_size=1000, max_pr_auc_drop=0.05,
+                 niceness=19):
+        self.detector = detector
+        self.check_interval = check_interval
+        self.canary_path = canary_path
+        self.canary_size = canary_size
+        self.max_pr_auc_drop = max_pr_auc_drop
+        self.niceness = niceness
+        self.reloads = 0
+        self.rejected = 0
+        self.last_error = None
+        self._rejected_signature = None
+        self._canary = None
+        # (model_version, canary PR-AUC) of the active model, scored once per version
+        self._active_pr_auc = (None, None)
+        self._worker = background_thread(self._run, 'model-watcher', niceness)
+
+    def ensure_running(self):
+        """Start this process's watcher thread if it is not running yet"""
+        if self.check_interval > 0:
+            self._worker.get()
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error checking for a new model: {e}")
+
+    def check(self):
+        """Swap in the bundle if it changed since the active version was read; True if swapped"""
+        signature = bundle_signature(self.detector.bundle_path)
+        active = self.detector.state
+        if signature is None or signature in (active.signature, self._rejected_signature):
+            return False
+
+        candidate = self.detector.read_bundle(mmap_mode='r')
+        if candidate is None:
+            return self._reject(signature, 'unsupported bundle format')
+        if candidate.model_version == active.model_version:
+            active.signature = signature
+            return False
+
+        problem = self.validate(candidate, active)
+        if problem:
+            return self._reject(signature, f"model {candidate.model_version}: {problem}")
+
+        self.detector.state = candidate
+        self.reloads += 1
+        print(f"Swapped in model version {candidate.model_version} (was {active.model_version})")
+        return True
+
+    def _reject(self, signature, reason):
+        self._rejected_signature = signature
+        self.rejected += 1
+        self.last_error = reason
+        print(f"Rejected new model bundle, keeping the active model: {reason}")
+        return False
+
+    def canary(self):
+        """Labeled transactions new models are checked on, loaded once"""
+        if self._canary is None:
+            if self.canary_path:
+                raw = pd.read_csv(self.canary_path)
+                self._canary = self.detector.process_real_data(self.detector.map_column_names(raw))
+            else:
+                self._canary = self.detector.generate_synthetic_data(self.canary_size)
+        return self._canary
+
+    def score(self, state, canary):
+        """Fraud probabilities of a model version on the canary set"""
+        df = self.detector.encode_categorical_features(canary.copy(), fit=False, state=state)
+        X = df[self.detector.feature_names]
+        X_scaled = state.scaler.transform(X)
+        probabilities = state.model.predict_proba(X_scaled)[:, 1]
+
+        # Also warms up the compiled forest that will serve single requests
+        if state.compiled_forest is not None:
+            X_compiled = X.to_numpy(dtype=np.float64) if state.scaler_folded else X_scaled
+            compiled = state.compiled_forest.predict_proba(X_compiled)[:, 1]
+            if not np.allclose(compiled, probabilities):
+                raise ValueError("compiled forest does not match the model")
+        return probabilities
+
+    def validate(self, candidate, active):
+        """Why candidate must not replace active, or None if it may"""
+        canary = self.canary()
+        try:
+            probabilities = self.score(candidate, canary)
+        except Exception as e:
+            return f"canary scoring failed: {e}"
+        if not np.all(np.isfinite(probabilities)) or probabilities.min() < 0 or probabilities.max() > 1:
+            return "invalid fraud probabilities on the canary set"
+
+        y = canary['is_fraud'].to_numpy()
+        if active.model is None or len(np.unique(y)) < 2:
+            return None
+        candidate_pr_auc = average_precision_score(y, probabilities)
+        version, active_pr_auc = self._active_pr_auc
+        if version != active.model_version or active_pr_auc is None:
+            active_pr_auc = average_precision_score(y, self.score(active, canary))
+        # Once swapped in, the candidate's score is the active one
+        self._active_pr_auc = (candidate.model_version, candidate_pr_auc)
+        if candidate_pr_auc < active_pr_auc - self.max_pr_auc_drop:
+            return f"canary PR-AUC {candidate_pr_auc:.3f} vs {active_pr_auc:.3f} for the active model"
+        return None
+
+    def stats(self):
+        """Active version and reload counts for /stats"""
+        return {
+            'model_version': self.detector.model_version,
+            'check_interval': self.check_interval,
+            'reloads': self.reloads,
+            'rejected': self.rejected,
+            'last_error': self.last_error
+        }
@@ -0,0 +1,90 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from background import PerProcess, lower_thread_priority
+
+
+class PasswordHasher:
+    """Salted scrypt password hashes, computed on a small dedicated thread pool
+
+    Hashes are stored as scrypt$n$r$p$salt$hash. The cost parameters
+    travel with each hash, so raising n only affects new hashes.
+    Passwords stored as a bare unsalted SHA-256 hex digest (the
+    original format) are still accepted. verify() then returns a
+    scrypt hash to store in their place. It does the same for scrypt
+    hashes made with other cost parameters.
+
+    scrypt takes tens of milliseconds of CPU and about 128 * n * r bytes
+    of memory per hash. It releases the GIL, and it runs on at most threads
+    threads per process, so a burst of logins cannot take more than that
+    many cores. At most queue_limit further hashes wait for a thread, and
+    callers beyond that block until one is free. On Linux the pool threads
+    also lower their scheduling priority to niceness, so /predict request
+    threads preempt them on a busy CPU.
+    """
+
+    def __init__(self, n=2**14, r=8, p=1, threads=2, queue_limit=64, niceness=10):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.threads = threads
+        self.niceness = niceness
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self._slots = threading.BoundedSemaphore(threads + queue_limit)
+        self._executor = PerProcess(lambda: ThreadPoolExecutor(max_workers=threads, thread_name_prefix='password-hash',
+                                                               initializer=lower_thread_priority,
+                                                               initargs=(niceness,)))
+
+    def _run(self, func, *args):
+        with self._slots:
+            return self._executor.get().submit(func, *args).result()
+
+    def _scrypt(self, password, salt, n, r, p):
+        # maxmem must cover the 128 * n * r * p bytes scrypt needs, plus some slack
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=128 * n * r * (p + 1) + 2**20,
+                              dklen=32)
+
+    def _hash(self, password):
+        salt = os.urandom(16)
+        key = self._scrypt(password, salt, self.n, self.r, self.p)
+        self.hashed += 1
+        return '$'.join(['scrypt', str(self.n), str(self.r), str(self.p),
+                         base64.b64encode(salt).decode(), base64.b64encode(key).decode()])
+
+    def _verify(self, password, stored):
+        self.verified += 1
+        if stored.startswith('scrypt$'):
+            _, n, r, p, salt, key = stored.split('$')
+            n, r, p = int(n), int(r), int(p)
+            if not hmac.compare_digest(self._scrypt(password, base64.b64decode(salt), n, r, p), base64.b64decode(key)):
+                return False, None
+            if (n, r, p) == (self.n, self.r, self.p):
+                return True, None
+        elif not hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored):
+            return False, None
+        self.rehashed += 1
+        return True, self._hash(password)
+
+    def hash(self, password):
+        """Salted scrypt hash of password, to store"""
+        return self._run(self._hash, password)
+
+    def verify(self, password, stored):
+        """(matches, new hash to store or None) for a password against a stored hash"""
+        return self._run(self._verify, password, stored)
+
+    def stats(self):
+        return {
+            'n': self.n,
+            'r': self.r,
+            'p': self.p,
+            'threads': self.threads,
+            'hashed': self.hashed,
+            'verified': self.verified,
+            'rehashed': self.rehashed
+        }
@@ -10,6 +10,8 @@ import pandas as pd
 import numpy as np
 import os
 import sys
+from fraud_detector import FraudDetector
+from ingest import StratifiedReservoir
 
 def analyze_dataset(file_path):
     """Analyze the structure of a dataset"""
@@ -69,7 +71,7 @@ def analyze_dataset(file_path):
         print(f"Error analyzing dataset: {e}")
         return False
 
-def prepare_upi_dataset(input_file, output_file=None):
+def prepare_upi_dataset(input_file, output_file=None, sample_size=100000, chunksize=100000):
     """Prepare UPI dataset for fraud detection"""
     
     if output_file is None:
@@ -80,20 +82,25 @@ def prepare_upi_dataset(input_file, output_file=None):
     print("=" * 50)
     
     try:
-        # Load the dataset
-        df = pd.read_csv(input_file)
-        print(f"Loaded {len(df):,} transactions")
+        # Stratify on the fraud label so a sample keeps the original fraud rate
+        header = pd.read_csv(input_file, nrows=0)
+        mapped = FraudDetector().map_column_names(header).columns
+        label_cols = [raw for raw, name in zip(header.columns, mapped) if name == 'is_fraud']
         
-        # Basic data cleaning
+        # Stream the file so datasets larger than memory can be sampled
         print("Performing basic data cleaning...")
-        
-        # Remove completely empty rows
-        df = df.dropna(how='all')
-        
-        # If dataset is very large, sample it for faster processing
-        if len(df) > 100000:
-            print(f"Dataset is large ({len(df):,} rows). Sampling 100,000 rows...")
-            df = df.sample(n=100000, random_state=42).reset_index(drop=True)
+        reservoir = StratifiedReservoir(sample_size, strata_column=label_cols[0] if label_cols else '_stratum')
+        for chunk in pd.read_csv(input_file, chunksize=chunksize):
+            # Remove completely empty rows
+            chunk = chunk.dropna(how='all')
+            if not label_cols:
+                chunk['_stratum'] = 0
+            reservoir.add(chunk)
+        
+        print(f"Loaded {reservoir.total_seen:,} transactions")
+        if reservoir.total_seen > sample_size:
+            print(f"Dataset is large ({reservoir.total_seen:,} rows). Kept a stratified sample of {sample_size:,} rows")
+        df = reservoir.sample().drop(columns=['_stratum'], errors='ignore')
         
         print(f"Final dataset size: {len(df):,} transactions")
         
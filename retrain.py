@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Incremental Retraining for FraudShield
+======================================
+
+Adds trees fitted on newly labeled transactions to the saved model instead
+of retraining it from scratch, e.g. from an hourly cron job.
+"""
+
+import sys
+import pandas as pd
+from fraud_detector import FraudDetector
+
+
+def main():
+    """Main function"""
+    print("FraudShield Incremental Retraining")
+    print("==================================")
+
+    if len(sys.argv) < 2 or not all(arg.isdigit() for arg in sys.argv[2:]):
+        print("\nUsage:")
+        print("  python retrain.py <labeled_transactions.csv> [n_new_trees] [retire_trees]")
+        print("\nThe file uses the same columns as the training data. n_new_trees (default 20)")
+        print("are added to the saved model and the retire_trees (default 0) oldest are dropped.")
+        return
+
+    detector = FraudDetector()
+    if not detector.load_model():
+        print("No saved model to update; run the app or train a model first.")
+        return
+
+    df = detector.process_real_data(detector.map_column_names(pd.read_csv(sys.argv[1])))
+    n_new_trees = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    retire_trees = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    detector.update_model(df, n_new_trees=n_new_trees, retire_trees=retire_trees)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import json
+import operator
+import os
+import threading
+import time
+import numpy as np
+
+# Transaction fields a rule may test
+RULE_FEATURES = [
+    'amount', 'hour', 'merchant_category', 'payment_method', 'customer_age',
+    'transaction_frequency', 'location_risk_score'
+]
+
+# op -> (test on one value, test on a NumPy column)
+COMPARISONS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+OPERATORS = {op: (func, func) for op, func in COMPARISONS.items()}
+OPERATORS.update({
+    'in': (lambda x, v: x in v, lambda x, v: np.isin(x, list(v))),
+    'not_in': (lambda x, v: x not in v, lambda x, v: ~np.isin(x, list(v))),
+    'between': (lambda x, v: v[0] <= x <= v[1], lambda x, v: (x >= v[0]) & (x <= v[1])),
+    'outside': (lambda x, v: x < v[0] or x > v[1], lambda x, v: (x < v[0]) | (x > v[1])),
+})
+
+MAX_RULES = 64
+
+
+class RuleSet:
+    """Risk-factor rules declared as data and evaluated into one bitmask per transaction
+
+    Bit i of a transaction's mask is set when rule i fires. Masks are cheap
+    to compute for a whole batch with NumPy column operations; the messages
+    shown to users are only built from a mask when they are asked for.
+    """
+
+    def __init__(self, rules, no_factors_message="No specific risk factors identified"):
+        if len(rules) > MAX_RULES:
+            raise ValueError(f'At most {MAX_RULES} rules fit in a mask, got {len(rules)}')
+        self.rules = []
+        for rule in rules:
+            if rule['feature'] not in RULE_FEATURES:
+                raise ValueError(f"Rule {rule['name']!r} tests unknown feature {rule['feature']!r}")
+            if rule['op'] not in OPERATORS:
+                raise ValueError(f"Rule {rule['name']!r} uses unknown op {rule['op']!r}")
+            value = rule['value']
+            if rule['op'] in ('in', 'not_in'):
+                value = frozenset(value)
+            self.rules.append((rule['name'], rule['feature'], rule['op'], value, rule['message']))
+        self.names = [name for name, *_ in self.rules]
+        # Resolved once so evaluation is a flat loop over (bit, feature, test, value)
+        self._scalar_tests = [(1 << bit, feature, OPERATORS[op][0], value)
+                              for bit, (_, feature, op, value, _) in enumerate(self.rules)]
+        self._column_tests = [(np.uint64(bit), feature, OPERATORS[op][1], value)
+                              for bit, (_, feature, op, value, _) in enumerate(self.rules)]
+        self.no_factors_message = no_factors_message
+        self._messages = {}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            spec = json.load(f)
+        return cls(spec['rules'], spec.get('no_factors_message', "No specific risk factors identified"))
+
+    def evaluate_one(self, transaction):
+        """Bitmask of the rules a single transaction triggers"""
+        mask = 0
+        for bit, feature, test, value in self._scalar_tests:
+            if test(transaction[feature], value):
+                mask |= bit
+        return mask
+
+    def evaluate(self, df):
+        """Bitmasks for every row of a DataFrame, as a uint64 array"""
+        masks = np.zeros(len(df), dtype=np.uint64)
+        for bit, feature, test, value in self._column_tests:
+            fired = test(df[feature].to_numpy(), value)
+            masks |= fired.astype(np.uint64) << bit
+        return masks
+
+    def describe(self, mask):
+        """Human-readable risk factors for a mask, in rule order"""
+        mask = int(mask)
+        messages = self._messages.get(mask)
+        if messages is None:
+            messages = [message for bit, (*_, message) in enumerate(self.rules) if mask >> bit & 1]
+            messages = tuple(messages or [self.no_factors_message])
+            # At most 2**len(rules) entries, and far fewer in practice
+            self._messages[mask] = messages
+        return list(messages)
+
+
+class RuleBook:
+    """The rule set in a JSON file, reloaded whenever the file changes
+
+    Each process checks the file's mtime at most once per check_interval
+    seconds, so editing the file updates every worker without a restart.
+    A file that fails to parse is reported and the previous rules are kept.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._rules = None
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self):
+        """The current RuleSet, reloading it if the file has changed"""
+        now = time.monotonic()
+        if self._rules is None or now >= self._next_check:
+            with self._lock:
+                if self._rules is None or now >= self._next_check:
+                    self._next_check = now + self.check_interval
+                    self._reload_if_changed()
+        return self._rules
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if self._rules is None:
+                raise
+            print(f"Risk rules file unavailable, keeping current rules: {e}")
+            return
+        if mtime == self._mtime:
+            return
+        # Remember the mtime even if parsing fails, so a bad file is reported once
+        self._mtime = mtime
+        try:
+            self._rules = RuleSet.from_file(self.path)
+            print(f"Loaded {len(self._rules.rules)} risk rules from {self.path}")
+        except Exception as e:
+            if self._rules is None:
+                self._mtime = None
+                raise
+            print(f"Error reloading risk rules, keeping current rules: {e}")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Model Rollback for FraudShield
+==============================
+
+Puts the model bundle replaced by the last save back in place. Running
+workers pick it up within MODEL_RELOAD_INTERVAL seconds; running the
+script again rolls forward.
+"""
+
+import sys
+import joblib
+from fraud_detector import FraudDetector
+
+
+def bundle_version(path):
+    return joblib.load(path, mmap_mode='r')['model_version']
+
+
+def main():
+    """Main function"""
+    print("FraudShield Model Rollback")
+    print("==========================")
+
+    if len(sys.argv) > 1:
+        print("\nUsage:")
+        print("  python rollback.py")
+        return
+
+    detector = FraudDetector()
+    try:
+        previous = bundle_version(detector.previous_bundle_path)
+        current = bundle_version(detector.bundle_path)
+        detector.rollback_model()
+    except FileNotFoundError as e:
+        print(f"Nothing to roll back to: {e}")
+        return
+    print(f"Rolled back from version {current} to {previous}")
+
+
+if __name__ == "__main__":
+    main()
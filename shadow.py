@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Shadow Scoring for FraudShield
+==============================
+
+Runs a candidate model on a sample of live /predict traffic next to the
+active one, so it can be compared before it is promoted.
+"""
+
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import numpy as np
+from background import background_thread
+from fraud_detector import FraudDetector, bundle_signature
+
+# Where candidate models are trained to and shadow-scored from
+CANDIDATE_BUNDLE_PATH = 'model_bundle_candidate.joblib'
+
+SHADOW_COUNTS = ['sampled', 'scored', 'dropped_queue_full', 'dropped_over_budget', 'errors']
+
+
+class ShadowScorer:
+    """Scores sampled live transactions with a candidate model, off the response path
+
+    submit() only draws a random number and puts the transaction on a
+    bounded queue: it never blocks and never scores. One low-priority thread
+    per worker process collects queued transactions for up to batch_wait
+    seconds (or batch_size of them), scores each batch at once with the
+    candidate bundle at path, and records its probability and decision next
+    to the live model's in a ring buffer of the last buffer_size scores.
+
+    Everything the thread does, including loading the candidate, is charged
+    to a token bucket of CPU time that refills at cpu_budget seconds per
+    second. While it is empty, sampled transactions are dropped, so shadow
+    scoring never uses more than that share of a core.
+    """
+
+    def __init__(self, detector, path=CANDIDATE_BUNDLE_PATH, sample_rate=0.1, cpu_budget=0.05, queue_size=256,
+                 buffer_size=10000, batch_size=64, batch_wait=0.05, check_interval=5.0, niceness=19):
+        self.detector = detector
+        self.path = path
+        self.sample_rate = sample_rate
+        self.cpu_budget = cpu_budget
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.check_interval = check_interval
+        self.niceness = niceness
+        self.candidate = None
+        self.counts = dict.fromkeys(SHADOW_COUNTS, 0)
+        self.cpu_seconds = 0.0
+        self._queue = queue.Queue(queue_size)
+        # CPU seconds the thread may still use; refills up to one second's budget
+        self._allowance = cpu_budget
+        self._refilled = time.monotonic()
+        self._next_check = 0.0
+        self._worker = background_thread(self._run, 'shadow-scorer', niceness)
+        self._lock = threading.Lock()
+
+        # Ring buffer of live and candidate results
+        self._live = np.zeros(buffer_size)
+        self._shadow = np.zeros(buffer_size)
+        self._live_flags = np.zeros(buffer_size, dtype=bool)
+        self._recorded = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path) and self.sample_rate > 0 and self.cpu_budget > 0
+
+    def submit(self, transaction_data, fraud_probability, is_fraud):
+        """Offer a transaction the live model has scored for shadow scoring"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return
+        self._worker.get()
+        if self.candidate is None:
+            return
+        if self._available(time.monotonic()) <= 0:
+            self.counts['dropped_over_budget'] += 1
+            return
+        try:
+            self._queue.put_nowait((transaction_data, fraud_probability, is_fraud))
+        except queue.Full:
+            self.counts['dropped_queue_full'] += 1
+            return
+        self.counts['sampled'] += 1
+
+    def _available(self, now):
+        return min(self.cpu_budget, self._allowance + (now - self._refilled) * self.cpu_budget)
+
+    def _charge(self, cpu_seconds):
+        now = time.monotonic()
+        self._allowance = self._available(now) - cpu_seconds
+        self._refilled = now
+        self.cpu_seconds += cpu_seconds
+
+    def _run(self):
+        while True:
+            # thread_time only advances while this thread is on a CPU, not while it waits
+            start = time.thread_time()
+            batch = []
+            try:
+                self._check_candidate()
+                batch = self._next_batch()
+                if batch and self.candidate is not None:
+                    if self._available(time.monotonic()) > 0:
+                        self._record(batch, self.score(batch))
+                    else:
+                        self.counts['dropped_over_budget'] += len(batch)
+            except Exception as e:
+                self.counts['errors'] += len(batch)
+                print(f"Shadow scoring error: {e}")
+            self._charge(time.thread_time() - start)
+
+    def _next_batch(self):
+        """Up to batch_size queued transactions, or none after check_interval seconds"""
+        try:
+            batch = [self._queue.get(timeout=self.check_interval)]
+        except queue.Empty:
+            return []
+        # Scoring rows one at a time costs several times more CPU per row than a batch;
+        # sleeping (rather than waiting on the queue) keeps submit() from waking this thread
+        time.sleep(self.batch_wait)
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _check_candidate(self):
+        """Load the candidate bundle when it appears or changes"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        signature = bundle_signature(self.path)
+        if signature is None:
+            self.candidate = None
+        elif self.candidate is None or self.candidate.signature != signature:
+            candidate = self.detector.read_bundle(mmap_mode='r', path=self.path)
+            with self._lock:
+                self.candidate = candidate
+                self._recorded = 0
+            if candidate is not None:
+                print(f"Shadow scoring with candidate model version {candidate.model_version}")
+
+    def score(self, batch):
+        """Candidate fraud probabilities for a batch of queued transactions"""
+        candidate = self.candidate
+        # _transaction_to_row reuses one buffer per thread, so each row is copied out before the next is built
+        X = np.empty((len(batch), len(self.detector.feature_names)))
+        for i, (transaction, _, _) in enumerate(batch):
+            X[i] = self.detector._transaction_to_row(transaction, candidate)[0]
+        model = candidate.compiled_forest if candidate.compiled_forest is not None else candidate.model
+        return model.predict_proba(X)[:, 1]
+
+    def _record(self, batch, shadow):
+        with self._lock:
+            slots = (self._recorded + np.arange(len(batch))) % len(self._live)
+            self._live[slots] = [probability for _, probability, _ in batch]
+            self._live_flags[slots] = [is_fraud for _, _, is_fraud in batch]
+            self._shadow[slots] = shadow
+            self._recorded += len(batch)
+        self.counts['scored'] += len(batch)
+
+    def stats(self):
+        """Counts, CPU use and live-vs-candidate comparison over the ring buffer for /stats"""
+        with self._lock:
+            n = min(self._recorded, len(self._live))
+            live, shadow, live_flags = self._live[:n], self._shadow[:n], self._live_flags[:n]
+            delta = shadow - live
+            shadow_flags = shadow > 0.5
+            stats = {
+                'candidate_version': self.candidate.model_version if self.candidate is not None else None,
+                'sample_rate': self.sample_rate,
+                'cpu_budget': self.cpu_budget,
+                'cpu_seconds': round(self.cpu_seconds, 3),
+                **self.counts,
+                'window': n
+            }
+            if n:
+                stats.update({
+                    'mean_delta': round(float(delta.mean()), 4),
+                    'mean_abs_delta': round(float(np.abs(delta).mean()), 4),
+                    'p95_abs_delta': round(float(np.percentile(np.abs(delta), 95)), 4),
+                    'max_abs_delta': round(float(np.abs(delta).max()), 4),
+                    'disagreement_rate': round(float(np.mean(live_flags != shadow_flags)), 4),
+                    'flagged_by_candidate_only': int(np.count_nonzero(shadow_flags & ~live_flags)),
+                    'flagged_by_live_only': int(np.count_nonzero(live_flags & ~shadow_flags))
+                })
+        return stats
+
+
+def main():
+    """Main function"""
+    print("FraudShield Shadow Scoring")
+    print("==========================")
+
+    path = os.getenv('SHADOW_MODEL_PATH') or CANDIDATE_BUNDLE_PATH
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command not in ('train', 'promote'):
+        print("\nUsage:")
+        print("  python shadow.py train    - Train a candidate model into SHADOW_MODEL_PATH")
+        print("  python shadow.py promote  - Make the candidate the live model (undo with rollback.py)")
+        print(f"\nThe candidate bundle is {path}. Running workers with SHADOW_SAMPLE_RATE > 0")
+        print("shadow-score it and report the comparison under 'shadow' in /stats.")
+        return
+
+    detector = FraudDetector()
+    if command == 'train':
+        detector.bundle_path = path
+        detector.backend = os.getenv('MODEL_BACKEND', detector.backend)
+        detector.train_model()
+    else:
+        if not os.path.exists(path):
+            print(f"No candidate model at {path}")
+            return
+        detector.promote_model(path)
+        print(f"Promoted {path} to {detector.bundle_path}")
+
+
+if __name__ == "__main__":
+    main()
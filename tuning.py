@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Hyperparameter Search for FraudShield
+=====================================
+
+Successive-halving search over Random Forest settings that trades fraud
+recall against per-row inference latency.
+"""
+
+import itertools
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import precision_score, recall_score, average_precision_score
+from forest_engine import CompiledForest
+
+# The settings train_model has always used; always evaluated, and the latency reference
+DEFAULT_PARAMS = {'n_estimators': 100, 'max_depth': 10, 'min_samples_leaf': 1, 'max_features': 'sqrt'}
+
+SEARCH_SPACE = {
+    'n_estimators': [25, 50, 100, 200],
+    'max_depth': [6, 8, 10, 14, 18],
+    'min_samples_leaf': [1, 5, 20],
+    'max_features': ['sqrt', 0.5, None]
+}
+
+# Training data of the worker processes, set once per worker by the pool initializer
+_data = {}
+
+
+def _init_worker(X_train, y_train, X_val, y_val):
+    _data.update(X_train=X_train, y_train=y_train, X_val=X_val, y_val=y_val)
+
+
+def measure_latency(forest, X, n_rows=200):
+    """Median single-row predict_proba latency of a compiled forest, in microseconds"""
+    rows = X[:n_rows]
+    forest.predict_proba(rows[:1])
+    timings = np.empty(len(rows))
+    for i in range(len(rows)):
+        start = time.perf_counter()
+        forest.predict_proba(rows[i:i + 1])
+        timings[i] = time.perf_counter() - start
+    return float(np.median(timings) * 1e6)
+
+
+def evaluate_candidate(params, rows):
+    """Fit params on the first rows training rows and score it on the validation set"""
+    X_train, y_train = _data['X_train'][:rows], _data['y_train'][:rows]
+    X_val, y_val = _data['X_val'], _data['y_val']
+
+    start = time.perf_counter()
+    model = RandomForestClassifier(**params, random_state=42, class_weight='balanced', n_jobs=1)
+    model.fit(X_train, y_train)
+    train_seconds = time.perf_counter() - start
+
+    proba = model.predict_proba(X_val)[:, 1]
+    predicted = proba > 0.5
+    return {
+        'params': params,
+        'rows': rows,
+        'recall': float(recall_score(y_val, predicted, zero_division=0)),
+        'precision': float(precision_score(y_val, predicted, zero_division=0)),
+        'pr_auc': float(average_precision_score(y_val, proba)),
+        'latency_us': measure_latency(CompiledForest.from_sklearn(model), X_val),
+        'train_seconds': train_seconds
+    }
+
+
+def pareto_ranks(results):
+    """Non-dominated sorting rank of each result on (recall up, latency down); 0 is the front"""
+    ranks = [None] * len(results)
+    remaining = set(range(len(results)))
+    rank = 0
+    while remaining:
+        front = {
+            i for i in remaining
+            if not any(
+                results[j]['recall'] >= results[i]['recall'] and results[j]['latency_us'] <= results[i]['latency_us']
+                and (results[j]['recall'] > results[i]['recall'] or results[j]['latency_us'] < results[i]['latency_us'])
+                for j in remaining
+            )
+        }
+        for i in front:
+            ranks[i] = rank
+        remaining -= front
+        rank += 1
+    return ranks
+
+
+def sample_candidates(n_candidates, random_state=42):
+    """The default settings plus distinct random points of SEARCH_SPACE"""
+    grid = [dict(zip(SEARCH_SPACE, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    grid = [params for params in grid if params != DEFAULT_PARAMS]
+    rng = np.random.default_rng(random_state)
+    picked = rng.choice(len(grid), size=min(n_candidates - 1, len(grid)), replace=False)
+    return [dict(DEFAULT_PARAMS)] + [grid[i] for i in picked]
+
+
+def successive_halving(X_train, y_train, X_val, y_val, n_candidates=27, eta=3, n_final=4,
+                       latency_tolerance=0.1, n_jobs=None):
+    """Search SEARCH_SPACE, keeping the best 1/eta of the candidates each round
+
+    Each round trains every surviving candidate on eta times more rows than
+    the last, ending on the full training set. Survivors are picked by Pareto
+    rank on validation recall and single-row latency, then by recall, and at
+    least n_final reach the last round; the default settings always do, as a
+    reference. The chosen settings are the highest-recall point of the final
+    Pareto front whose latency is within latency_tolerance of the default's.
+    """
+    candidates = sample_candidates(n_candidates)
+    n_rounds = max(1, math.ceil(math.log(len(candidates) / n_final, eta)) + 1)
+    rows = max(min(1000, len(X_train)), len(X_train) // eta ** (n_rounds - 1))
+
+    # Shuffle once so every prefix of the training rows is a random subsample
+    order = np.random.default_rng(42).permutation(len(X_train))
+    X_train, y_train = X_train[order], y_train[order]
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    rounds = []
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                             initargs=(X_train, y_train, X_val, y_val)) as pool:
+        while True:
+            rows = min(rows, len(X_train))
+            start = time.perf_counter()
+            results = list(pool.map(evaluate_candidate, candidates, itertools.repeat(rows)))
+            print(f"Round {len(rounds) + 1}: {len(candidates)} candidates on {rows:,} rows "
+                  f"in {time.perf_counter() - start:.1f}s")
+            rounds.append({'rows': rows, 'results': results})
+            if rows == len(X_train):
+                break
+
+            ranks = pareto_ranks(results)
+            order = sorted(range(len(results)), key=lambda i: (ranks[i], -results[i]['recall'], results[i]['latency_us']))
+            keep = max(n_final, len(results) // eta)
+            candidates = [results[i]['params'] for i in order[:keep]]
+            if DEFAULT_PARAMS not in candidates:
+                candidates.append(dict(DEFAULT_PARAMS))
+            rows *= eta
+
+    final = rounds[-1]['results']
+    ranks = pareto_ranks(final)
+    front = sorted((r for r, rank in zip(final, ranks) if rank == 0), key=lambda r: r['latency_us'])
+    reference = next(r for r in final if r['params'] == DEFAULT_PARAMS)
+    budget = reference['latency_us'] * (1 + latency_tolerance)
+    affordable = [r for r in front if r['latency_us'] <= budget]
+    chosen = max(affordable, key=lambda r: r['recall']) if affordable else front[0]
+
+    return {
+        'chosen': chosen,
+        'reference': reference,
+        'latency_budget_us': budget,
+        'pareto_front': front,
+        'rounds': rounds
+    }
+
+
+def main():
+    """Main function"""
+    print("FraudShield Hyperparameter Search")
+    print("=================================")
+
+    if len(sys.argv) > 1 and not sys.argv[1].isdigit():
+        print("\nUsage:")
+        print("  python tuning.py [n_candidates]")
+        print("\nTrains on the same data as the app, then saves the chosen model and its")
+        print("search results next to the model bundle.")
+        return
+
+    from fraud_detector import FraudDetector
+    detector = FraudDetector()
+    detector.train_model(tune=True, n_candidates=int(sys.argv[1]) if len(sys.argv) > 1 else 27)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """Bounded LRU cache of user records with a time-to-live, found by id or email
+
+    create_user and update_user_profile write the row the database returned
+    through to the cache, so this worker never serves a profile older than
+    its own last write. Other workers see the change once their entry
+    expires after ttl seconds. Lookups for unknown emails are not cached, so
+    a new registration is visible to every worker straight away.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # user id -> (record, expiry); email -> user id
+        self._entries = OrderedDict()
+        self._ids_by_email = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires = entry
+        if time.monotonic() >= expires:
+            self._remove(user_id)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return dict(user)
+
+    def _remove(self, user_id):
+        user, _ = self._entries.pop(user_id)
+        if self._ids_by_email.get(user.get('email')) == user_id:
+            del self._ids_by_email[user['email']]
+
+    def get_by_id(self, user_id):
+        """Cached record of the user with this id, or None"""
+        with self._lock:
+            return self._lookup(user_id)
+
+    def get_by_email(self, email):
+        """Cached record of the user with this email, or None"""
+        with self._lock:
+            return self._lookup(self._ids_by_email.get(email))
+
+    def put(self, user):
+        with self._lock:
+            user_id = user['id']
+            if user_id in self._entries:
+                self._remove(user_id)
+            self._entries[user_id] = (dict(user), time.monotonic() + self.ttl)
+            self._ids_by_email[user.get('email')] = user_id
+            if len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        """Drop the cached record of a user whose row may have changed"""
+        with self._lock:
+            if user_id in self._entries:
+                self._remove(user_id)
+                self.invalidations += 1
+
+    def stats(self):
+        """Size and hit/miss/eviction counters for /stats"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }